@@ -5,7 +5,7 @@ echo ">>> Activando venv"
 source ./venv/bin/activate
 
 echo ">>> Instalando deps Python"
-pip install --quiet geopandas shapely fiona pyproj pandas
+pip install --quiet geopandas shapely fiona pyproj pandas pyogrio pyarrow
 
 echo ">>> Generando CSV evolución CCAA 2016–2025"
 python scripts/13-evo_ccaa_2016_2025.py
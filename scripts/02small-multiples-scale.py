@@ -2,13 +2,17 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import io
 import math
 from pathlib import Path
+from xml.sax.saxutils import quoteattr
 
 import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from pyproj import Transformer
 from shapely.validation import make_valid as _make_valid
-from shapely.geometry import Polygon, MultiPolygon, mapping
-import svgwrite
 
 
 def make_valid(geom):
@@ -21,60 +25,128 @@ def make_valid(geom):
             return geom
 
 
+def make_valid_array(geoms):
+    """
+    make_valid vectorizado (shapely 2), solo sobre las geometrías no válidas;
+    si falla, cae a make_valid geometría a geometría.
+    """
+    geoms = np.array(geoms, dtype=object)  # copia: no tocamos el array original
+    invalid = ~shapely.is_valid(geoms)
+    if invalid.any():
+        try:
+            geoms[invalid] = shapely.make_valid(geoms[invalid])
+        except Exception:
+            geoms[invalid] = [make_valid(g) for g in geoms[invalid]]
+    return geoms
+
+
 def ensure_crs_4326(gdf):
     """Si el GeoDataFrame no tiene CRS, asumimos EPSG:4326 (GeoJSON por defecto)."""
     return gdf.set_crs(4326) if gdf.crs is None else gdf
 
 
-def compute_area_ha(gdf, area_col_hint="area_ha"):
-    """Devuelve serie de área en hectáreas, usando EPSG:3035 si es necesario."""
+def to_crs_3035(gdf):
+    """Reproyecta a EPSG:3035 con un único Transformer sobre todas las coordenadas."""
     gdf = ensure_crs_4326(gdf)
-    if area_col_hint in gdf.columns and gdf[area_col_hint].notna().any():
-        out = gdf[area_col_hint].copy()
+    t = Transformer.from_crs(gdf.crs, 3035, always_xy=True)
+    geoms = shapely.transform(
+        gdf.geometry.to_numpy(),
+        lambda xy: np.column_stack(t.transform(xy[:, 0], xy[:, 1])),
+    )
+    return gdf.set_geometry(geoms, crs=3035)
+
+
+def compute_area_ha(gdf_aea, area_col_hint="area_ha"):
+    """Devuelve serie de área en hectáreas; lo que falte se mide sobre la geometría en EPSG:3035."""
+    if area_col_hint in gdf_aea.columns and gdf_aea[area_col_hint].notna().any():
+        out = gdf_aea[area_col_hint].copy()
         missing = out.isna()
         if missing.any():
-            aea = (gdf.loc[missing].to_crs(3035).geometry.area / 10_000.0)
-            out.loc[missing] = aea
+            out.loc[missing] = shapely.area(gdf_aea.geometry.values[missing.to_numpy()]) / 10_000.0
         return out.astype(float)
     else:
-        return (gdf.to_crs(3035).geometry.area / 10_000.0).astype(float)
+        areas = shapely.area(gdf_aea.geometry.values) / 10_000.0
+        return pd.Series(areas, index=gdf_aea.index, dtype=float)
 
 
-def path_from_polygon(poly: Polygon, ox: float, oy: float, scale: float,
+def path_from_polygon(poly, ox: float, oy: float, scale: float,
                       bounds: tuple, flip_y=True, precision=2) -> str:
+    """
+    Path SVG de un Polygon o MultiPolygon. Todos los anillos se transforman y
+    formatean en un único bloque NumPy (una sola pasada por feature, no por anillo).
+    Las coordenadas salen en punto fijo: enteros en unidades de 10**-precision px,
+    así que el <path> debe llevar transform="scale(...)" (ver path_scale).
+    """
     minx, miny, maxx, maxy = bounds
+    q = 10 ** precision
+
+    rings = shapely.get_rings(shapely.get_parts(poly))
+    counts = shapely.get_num_coordinates(rings)
+    rings, counts = rings[counts > 0], counts[counts > 0]
+    if len(rings) == 0:
+        return ""
+    xy = shapely.get_coordinates(rings)  # (n, 2) contiguo, anillos seguidos
+
+    X = (xy[:, 0] - minx) * scale + ox
+    Yraw = (xy[:, 1] - miny) * scale + oy
+    Y = (oy + (maxy - miny) * scale - (Yraw - oy)) if flip_y else Yraw
+
+    # "M" al empezar cada anillo, "L" en el resto y " Z" tras su último vértice
+    ends = np.cumsum(counts)
+    cmds = np.full(len(xy), "L ")
+    cmds[ends - counts] = "M "
+    closes = np.full(len(xy), "", dtype="<U2")
+    closes[ends - 1] = " Z"
+
+    # int -> str se hace en C; mucho más barato que "%.2f" por coordenada
+    Xs = np.rint(X * q).astype(np.int64).astype(str)
+    Ys = np.rint(Y * q).astype(np.int64).astype(str)
+    pts = np.char.add(np.char.add(Xs, " "), Ys)
+    # tolist() da a join una lista ya dimensionada de str nativos; iterar el
+    # array directamente crea un escalar NumPy por vértice
+    return " ".join(np.char.add(np.char.add(cmds, pts), closes).tolist())
+
+
+def path_scale(precision=2):
+    """transform que deshace el punto fijo de path_from_polygon."""
+    return f"scale({10 ** -precision})"
+
+
+def path_stroke_width(stroke_width, precision=2):
+    """stroke-width en las mismas unidades de punto fijo que el path: path_scale lo
+    devuelve a px sin depender de vector-effect (CairoSVG no lo soporta)."""
+    return f"{stroke_width * 10 ** precision:g}"
+
+
+SVG_HEADER = (
+    '<?xml version="1.0" encoding="utf-8" ?>\n'
+    '<svg baseProfile="full" height="{height}" version="1.1" width="{width}" '
+    'xmlns="http://www.w3.org/2000/svg" xmlns:ev="http://www.w3.org/2001/xml-events" '
+    'xmlns:xlink="http://www.w3.org/1999/xlink"><defs />'
+)
+
+
+def svg_attrs(**attrs):
+    """Atributos como texto (fill_rule -> fill-rule); omite vacíos, igual que svgwrite."""
+    return "".join(
+        f" {k.replace('_', '-')}={quoteattr(str(v))}"
+        for k, v in attrs.items() if v is not None and v != ""
+    )
 
-    def fmt(x): return f"{x:.{precision}f}"
-
-    def transform(x, y):
-        X = (x - minx) * scale + ox
-        Yraw = (y - miny) * scale + oy
-        return (X, (oy + (maxy - miny) * scale - (Yraw - oy)) if flip_y else Yraw)
-
-    def ring_to_cmds(coords):
-        cmds, first = [], True
-        for (x, y) in coords:
-            X, Y = transform(x, y)
-            cmds.append(("M" if first else "L", X, Y))
-            first = False
-        cmds.append(("Z", None, None))
-        return cmds
-
-    d_parts = []
-    ext = list(poly.exterior.coords)
-    for cmd, X, Y in ring_to_cmds(ext):
-        d_parts.append("Z" if cmd == "Z" else f"{cmd} {fmt(X)} {fmt(Y)}")
-
-    for hole in poly.interiors:
-        for cmd, X, Y in ring_to_cmds(list(hole.coords)):
-            d_parts.append("Z" if cmd == "Z" else f"{cmd} {fmt(X)} {fmt(Y)}")
 
-    return " ".join(d_parts)
+def save_svg(buf: io.StringIO, out_path: Path, pretty=False):
+    """Vuelca el buffer a disco. Con pretty=True indenta como svgwrite (más lento)."""
+    svg = buf.getvalue()
+    if pretty:
+        from svgwrite.utils import pretty_xml
+        head, body = svg.split("\n", 1)
+        svg = head + "\n" + pretty_xml(body)
+    out_path.write_text(svg, encoding="utf-8")
 
 
 def draw_geoms_to_svg_scaled(geoms, out_path: Path, cols=14, cell=64, margin=24,
                              fill="#000", stroke="#000", stroke_width=0.4,
-                             label=False, font_size=8):
+                             label=False, font_size=8, simplify_px=0.5, pretty=False):
     """Dibuja geometrías respetando escala global (área relativa)."""
     n = len(geoms)
     if n == 0:
@@ -83,67 +155,65 @@ def draw_geoms_to_svg_scaled(geoms, out_path: Path, cols=14, cell=64, margin=24,
 
     width = margin * 2 + cols * cell
     height = margin * 2 + rows * cell
-    dwg = svgwrite.Drawing(str(out_path), size=(width, height), profile="full")
+    buf = io.StringIO()
+    buf.write(SVG_HEADER.format(width=width, height=height))
+    # Atributos comunes en un único <g>, en unidades de punto fijo (como los paths)
+    group_attrs = svg_attrs(
+        fill=fill,
+        fill_rule="evenodd",
+        stroke=stroke,
+        stroke_width=path_stroke_width(stroke_width),
+        transform=path_scale(),
+    )
+    text_attrs = svg_attrs(fill="#555", font_family="MarcinAntB, sans-serif", font_size=font_size)
 
     inner_pad = 4
     inner = cell - inner_pad * 2
 
     # Escala global (según mancha más grande)
-    max_w = max(g.bounds[2] - g.bounds[0] for g in geoms if not g.is_empty)
-    max_h = max(g.bounds[3] - g.bounds[1] for g in geoms if not g.is_empty)
+    geoms_arr = np.asarray(geoms, dtype=object)
+    bounds_arr = shapely.bounds(geoms_arr)  # (n, 4), NaN si vacía
+    nonempty = ~shapely.is_empty(geoms_arr)
+    wh = bounds_arr[nonempty, 2:4] - bounds_arr[nonempty, 0:2]  # (n, 2): ancho, alto
+    max_w, max_h = wh.max(axis=0)
     global_scale = min(inner / max_w, inner / max_h)
 
-    for i, geom in enumerate(geoms):
-        if geom.is_empty:
-            continue
+    # Douglas-Peucker a resolución de salida: ningún vértice se mueve más de simplify_px
+    # (los bounds originales se mantienen para colocar cada mancha en su celda)
+    if simplify_px > 0:
+        geoms_arr = shapely.simplify(geoms_arr, tolerance=simplify_px / global_scale, preserve_topology=True)
+
+    # Solo Polygon (3) / MultiPolygon (6) no vacíos; el resto deja su celda en blanco
+    type_ids = shapely.get_type_id(geoms_arr)
+    drawable = np.flatnonzero(~shapely.is_empty(geoms_arr) & ((type_ids == 3) | (type_ids == 6)))
 
+    buf.write(f"<g{group_attrs}>")
+    for i in drawable.tolist():
         r, c = i // cols, i % cols
         ox_cell = margin + c * cell + inner_pad
         oy_cell = margin + r * cell + inner_pad
 
-        bounds = geom.bounds
+        bounds = tuple(bounds_arr[i])
         scale = global_scale  # mismo para todas
 
-        polys = []
-        if isinstance(geom, Polygon):
-            polys = [geom]
-        elif isinstance(geom, MultiPolygon):
-            polys = list(geom.geoms)
-        else:
-            mapped = mapping(geom)
-            if mapped.get("type") == "Polygon":
-                polys = [geom]
-            elif mapped.get("type") == "MultiPolygon":
-                polys = list(geom.geoms)
-            else:
-                continue
-
-        d_total = []
-        for poly in polys:
-            d = path_from_polygon(poly, ox_cell, oy_cell, scale, bounds, flip_y=True)
-            d_total.append(d)
-
-        path = dwg.path(
-            d=" ".join(d_total),
-            fill=fill,
-            stroke=stroke,
-            stroke_width=stroke_width,
-            fill_rule="evenodd",
-            style="vector-effect:non-scaling-stroke",
-        )
-        dwg.add(path)
-
-        if label:
+        # path (admite MultiPolygon: todas sus partes en un único bloque)
+        d = path_from_polygon(geoms_arr[i], ox_cell, oy_cell, scale, bounds, flip_y=True)
+        buf.write(f'<path d="{d}" />')
+    buf.write("</g>")
+
+    # Etiquetas (rank) aparte, fuera del grupo escalado
+    if label:
+        for i in drawable.tolist():
+            r, c = i // cols, i % cols
+            ox_cell = margin + c * cell + inner_pad
+            oy_cell = margin + r * cell + inner_pad
             rank = i + 1
-            dwg.add(dwg.text(
-                f"{rank}",
-                insert=(ox_cell + 2, oy_cell + 2 + font_size),
-                font_size=font_size,
-                font_family="MarcinAntB, sans-serif",
-                fill="#555"
-            ))
-
-    dwg.save()
+            buf.write(
+                f'<text{text_attrs} x="{ox_cell + 2}" y="{oy_cell + 2 + font_size}">{rank}</text>'
+            )
+
+    buf.write("</svg>")
+    save_svg(buf, out_path, pretty=pretty)
     return width, height
 
 
@@ -156,6 +226,9 @@ def main():
     ap.add_argument("--margin", type=int, default=24, help="Margen exterior en px")
     ap.add_argument("--stroke", type=float, default=0.4, help="Grosor del trazo px")
     ap.add_argument("--label", action="store_true", help="Pinta numeritos de ranking")
+    ap.add_argument("--simplify-px", type=float, default=0.5,
+                    help="Tolerancia de simplificación en px de salida (0 = sin simplificar)")
+    ap.add_argument("--pretty", action="store_true", help="SVG indentado y legible (más lento)")
     args = ap.parse_args()
 
     inp, out = Path(args.inp), Path(args.out)
@@ -165,12 +238,13 @@ def main():
     if gdf.empty:
         raise SystemExit("El GeoJSON está vacío.")
 
-    gdf = gdf.set_geometry(gdf.geometry.apply(make_valid))
+    gdf = gdf.set_geometry(make_valid_array(gdf.geometry.values), crs=gdf.crs)
     gdf = ensure_crs_4326(gdf)
 
-    gdf["area_ha_final"] = compute_area_ha(gdf, area_col_hint="area_ha")
-    gdf_sorted = gdf.sort_values("area_ha_final", ascending=False).reset_index(drop=True)
-    gdf_aea = gdf_sorted.to_crs(3035)
+    # Una sola reproyección: sirve para medir áreas y para dibujar
+    gdf_aea = to_crs_3035(gdf)
+    gdf_aea["area_ha_final"] = compute_area_ha(gdf_aea, area_col_hint="area_ha")
+    gdf_aea = gdf_aea.sort_values("area_ha_final", ascending=False).reset_index(drop=True)
 
     geoms = list(gdf_aea.geometry)
     w, h = draw_geoms_to_svg_scaled(
@@ -181,6 +255,8 @@ def main():
         margin=args.margin,
         stroke_width=args.stroke,
         label=args.label,
+        simplify_px=args.simplify_px,
+        pretty=args.pretty,
     )
 
     print(f"SVG escrito en: {out}  ({int(w)}×{int(h)} px)")
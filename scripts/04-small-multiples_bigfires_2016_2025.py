@@ -2,15 +2,21 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import io
 import math
+import re
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime, timezone
+from xml.sax.saxutils import escape, quoteattr
 
 import geopandas as gpd
+import numpy as np
 import pandas as pd
+import pyogrio
+import shapely
+from pyproj import Transformer
 from shapely.validation import make_valid as _make_valid
-from shapely.geometry import Polygon, MultiPolygon, mapping
-import svgwrite
 
 
 # ---------- util geom ----------
@@ -25,60 +31,134 @@ def make_valid(geom):
             return geom
 
 
+def make_valid_array(geoms):
+    """
+    make_valid vectorizado (shapely 2), solo sobre las geometrías no válidas;
+    si falla, cae a make_valid geometría a geometría.
+    """
+    geoms = np.array(geoms, dtype=object)  # copia: no tocamos el array original
+    invalid = ~shapely.is_valid(geoms)
+    if invalid.any():
+        try:
+            geoms[invalid] = shapely.make_valid(geoms[invalid])
+        except Exception:
+            geoms[invalid] = [make_valid(g) for g in geoms[invalid]]
+    return geoms
+
+
 def ensure_crs_4326(gdf):
     """Si el GeoDataFrame no tiene CRS, asumimos EPSG:4326 (GeoJSON por defecto)."""
     return gdf.set_crs(4326) if gdf.crs is None else gdf
 
 
-def compute_area_ha(gdf, area_col_hint="area_ha"):
+def to_crs_3035(gdf):
     """
-    Devuelve serie de área en hectáreas, usando el campo 'area_ha' si existe y es válido.
-    Si faltan algunos valores, calcula en EPSG:3035 (LAEA Europe).
+    Reproyecta a EPSG:3035 con un único pyproj.Transformer, pasando todas las
+    coordenadas de golpe (evita el coste por llamada de GeoDataFrame.to_crs).
     """
     gdf = ensure_crs_4326(gdf)
-    if area_col_hint in gdf.columns and gdf[area_col_hint].notna().any():
-        out = gdf[area_col_hint].copy()
+    t = Transformer.from_crs(gdf.crs, 3035, always_xy=True)
+    geoms = shapely.transform(
+        gdf.geometry.to_numpy(),
+        lambda xy: np.column_stack(t.transform(xy[:, 0], xy[:, 1])),
+    )
+    return gdf.set_geometry(geoms, crs=3035)
+
+
+def compute_area_ha(gdf_aea, area_col_hint="area_ha"):
+    """
+    Devuelve serie de área en hectáreas, usando el campo 'area_ha' si existe y es válido.
+    Si faltan algunos valores, los mide sobre la geometría, que ya debe venir en
+    EPSG:3035 (LAEA Europe; ver to_crs_3035), sin volver a reproyectar.
+    """
+    if area_col_hint in gdf_aea.columns and gdf_aea[area_col_hint].notna().any():
+        out = gdf_aea[area_col_hint].copy()
         missing = out.isna()
         if missing.any():
-            aea = (gdf.loc[missing].to_crs(3035).geometry.area / 10_000.0)
-            out.loc[missing] = aea
+            out.loc[missing] = shapely.area(gdf_aea.geometry.values[missing.to_numpy()]) / 10_000.0
         return out.astype(float)
     else:
-        return (gdf.to_crs(3035).geometry.area / 10_000.0).astype(float)
+        areas = shapely.area(gdf_aea.geometry.values) / 10_000.0
+        return pd.Series(areas, index=gdf_aea.index, dtype=float)
 
 
 # ---------- svg helpers ----------
 
-def path_from_polygon(poly: Polygon, ox: float, oy: float, scale: float,
+def path_from_polygon(poly, ox: float, oy: float, scale: float,
                       bounds: tuple, flip_y=True, precision=2) -> str:
+    """
+    Path SVG de un Polygon o MultiPolygon. Todos los anillos se transforman y
+    formatean en un único bloque NumPy (una sola pasada por feature, no por anillo).
+    Las coordenadas salen en punto fijo: enteros en unidades de 10**-precision px,
+    así que el <path> debe llevar transform="scale(...)" (ver path_scale).
+    """
     minx, miny, maxx, maxy = bounds
+    q = 10 ** precision
+
+    rings = shapely.get_rings(shapely.get_parts(poly))
+    counts = shapely.get_num_coordinates(rings)
+    rings, counts = rings[counts > 0], counts[counts > 0]
+    if len(rings) == 0:
+        return ""
+    xy = shapely.get_coordinates(rings)  # (n, 2) contiguo, anillos seguidos
+
+    X = (xy[:, 0] - minx) * scale + ox
+    Yraw = (xy[:, 1] - miny) * scale + oy
+    Y = (oy + (maxy - miny) * scale - (Yraw - oy)) if flip_y else Yraw
+
+    # "M" al empezar cada anillo, "L" en el resto y " Z" tras su último vértice
+    ends = np.cumsum(counts)
+    cmds = np.full(len(xy), "L ")
+    cmds[ends - counts] = "M "
+    closes = np.full(len(xy), "", dtype="<U2")
+    closes[ends - 1] = " Z"
+
+    # int -> str se hace en C; mucho más barato que "%.2f" por coordenada
+    Xs = np.rint(X * q).astype(np.int64).astype(str)
+    Ys = np.rint(Y * q).astype(np.int64).astype(str)
+    pts = np.char.add(np.char.add(Xs, " "), Ys)
+    # tolist() da a join una lista ya dimensionada de str nativos; iterar el
+    # array directamente crea un escalar NumPy por vértice
+    return " ".join(np.char.add(np.char.add(cmds, pts), closes).tolist())
+
+
+# ---------- svg streaming ----------
+
+def path_scale(precision=2):
+    """transform que deshace el punto fijo de path_from_polygon."""
+    return f"scale({10 ** -precision})"
+
 
-    def fmt(x): return f"{x:.{precision}f}"
+def path_stroke_width(stroke_width, precision=2):
+    """stroke-width en las mismas unidades de punto fijo que el path: path_scale lo
+    devuelve a px sin depender de vector-effect (CairoSVG no lo soporta)."""
+    return f"{stroke_width * 10 ** precision:g}"
 
-    def transform(x, y):
-        X = (x - minx) * scale + ox
-        Yraw = (y - miny) * scale + oy
-        return (X, (oy + (maxy - miny) * scale - (Yraw - oy)) if flip_y else Yraw)
 
-    def ring_to_cmds(coords):
-        cmds, first = [], True
-        for (x, y) in coords:
-            X, Y = transform(x, y)
-            cmds.append(("M" if first else "L", X, Y))
-            first = False
-        cmds.append(("Z", None, None))
-        return cmds
+SVG_HEADER = (
+    '<?xml version="1.0" encoding="utf-8" ?>\n'
+    '<svg baseProfile="full" height="{height}" version="1.1" width="{width}" '
+    'xmlns="http://www.w3.org/2000/svg" xmlns:ev="http://www.w3.org/2001/xml-events" '
+    'xmlns:xlink="http://www.w3.org/1999/xlink"><defs />'
+)
 
-    d_parts = []
-    ext = list(poly.exterior.coords)
-    for cmd, X, Y in ring_to_cmds(ext):
-        d_parts.append("Z" if cmd == "Z" else f"{cmd} {fmt(X)} {fmt(Y)}")
 
-    for hole in poly.interiors:
-        for cmd, X, Y in ring_to_cmds(list(hole.coords)):
-            d_parts.append("Z" if cmd == "Z" else f"{cmd} {fmt(X)} {fmt(Y)}")
+def svg_attrs(**attrs):
+    """Atributos como texto (fill_rule -> fill-rule); omite vacíos, igual que svgwrite."""
+    return "".join(
+        f" {k.replace('_', '-')}={quoteattr(str(v))}"
+        for k, v in attrs.items() if v is not None and v != ""
+    )
+
 
-    return " ".join(d_parts)
+def save_svg(buf: io.StringIO, out_path: Path, pretty=False):
+    """Vuelca el buffer a disco. Con pretty=True indenta como svgwrite (más lento)."""
+    svg = buf.getvalue()
+    if pretty:
+        from svgwrite.utils import pretty_xml
+        head, body = svg.split("\n", 1)
+        svg = head + "\n" + pretty_xml(body)
+    out_path.write_text(svg, encoding="utf-8")
 
 
 # ---------- color rules ----------
@@ -87,45 +167,43 @@ COLOR_2025 = "#fac4c5"
 COLOR_RECENT = "#a80127"  # firedate >= cutoff
 COLOR_DEFAULT = "#d8d0d0"
 
-def parse_firedate(val):
+def parse_firedates(values):
     """
-    Devuelve datetime con tz UTC si hay valor ISO; None si no es parseable.
+    Devuelve serie de datetimes tz UTC a partir de valores ISO; NaT si no es parseable.
     """
-    if val is None or val == "":
-        return None
-    try:
-        # pandas maneja bien 'Z' y milisegundos
-        ts = pd.to_datetime(val, utc=True)
-        if pd.isna(ts):
-            return None
-        return ts.to_pydatetime()
-    except Exception:
-        return None
+    # pandas maneja bien 'Z' y milisegundos
+    return pd.to_datetime(values, utc=True, errors="coerce", format="ISO8601")
 
-def pick_color(row, cutoff_dt_utc):
+def pick_colors(gdf, cutoff_dt_utc):
     """
+    Array de colores (uno por feature), calculado en bloque.
     Prioridad:
       1) firedate >= 2025-08-08 → COLOR_RECENT  (incluye el día 8)
       2) fireyear == 2025       → COLOR_2025
       3) resto                  → COLOR_DEFAULT
     """
-    fd = parse_firedate(row.get("firedate"))
-    if fd is not None:
-        # asegurar tz-aware (UTC)
-        if fd.tzinfo is None:
-            fd = fd.replace(tzinfo=timezone.utc)
-        if fd >= cutoff_dt_utc:   # <-- incluye el propio día 8
-            return COLOR_RECENT
-    if int(row.get("fireyear")) == 2025:
-        return COLOR_2025
-    return COLOR_DEFAULT
+    if "firedate" in gdf.columns:
+        recent = (parse_firedates(gdf["firedate"]) >= cutoff_dt_utc).to_numpy()
+    else:
+        recent = np.zeros(len(gdf), dtype=bool)
+    year_2025 = (pd.to_numeric(gdf["fireyear"], errors="coerce") == 2025).to_numpy()
+    return np.where(recent, COLOR_RECENT, np.where(year_2025, COLOR_2025, COLOR_DEFAULT))
 
 
 # ---------- draw ----------
 
+# 5 líneas muy compactas (mun, prov, ha, ccaa, fireyear) en una sola escritura
+LABEL_TPL = (
+    '<text fill="#444"{attrs} x="{x}" y="{y0}">{mun}</text>'
+    '<text fill="#222"{attrs} x="{x}" y="{y1}">{prov}</text>'
+    '<text fill="#222"{attrs} x="{x}" y="{y2}">{ha}</text>'
+    '<text fill="#000"{attrs} x="{x}" y="{y3}">{ccaa}</text>'
+    '<text fill="#000"{attrs} x="{x}" y="{y4}">{fireyear}</text>'
+)
+
 def draw_geoms_to_svg_scaled(gdf, out_path: Path, cols=14, cell=64, margin=24,
                              stroke="", stroke_width=0,
-                             label=False, font_size=7):
+                             label=False, font_size=7, simplify_px=0.5, pretty=False):
     """
     Dibuja geometrías con escala GLOBAL (comparables en área), en rejilla.
     Colorea cada feature según reglas (firedate / fireyear).
@@ -139,128 +217,122 @@ def draw_geoms_to_svg_scaled(gdf, out_path: Path, cols=14, cell=64, margin=24,
 
     width = margin * 2 + cols * cell
     height = margin * 2 + rows * cell
-    dwg = svgwrite.Drawing(str(out_path), size=(width, height), profile="full")
+    buf = io.StringIO()
+    buf.write(SVG_HEADER.format(width=width, height=height))
+    # Atributos comunes en el <g> de cada color, en unidades de punto fijo (como los paths)
+    group_attrs = dict(
+        fill_rule="evenodd",
+        stroke=stroke,
+        stroke_width=path_stroke_width(stroke_width),
+        transform=path_scale(),
+    )
+    text_attrs = svg_attrs(font_family="MarcinAntB, sans-serif", font_size=font_size)
 
     inner_pad = 4
     inner = cell - inner_pad * 2
 
     # Escala global a partir de todas las geometrías
-    max_w = max(g.bounds[2] - g.bounds[0] for g in geoms if not g.is_empty)
-    max_h = max(g.bounds[3] - g.bounds[1] for g in geoms if not g.is_empty)
+    geoms_arr = np.asarray(geoms, dtype=object)
+    bounds_arr = shapely.bounds(geoms_arr)  # (n, 4), NaN si vacía
+    nonempty = ~shapely.is_empty(geoms_arr)
+    wh = bounds_arr[nonempty, 2:4] - bounds_arr[nonempty, 0:2]  # (n, 2): ancho, alto
+    max_w, max_h = wh.max(axis=0)
     global_scale = min(inner / max_w, inner / max_h)
 
+    # Douglas-Peucker a resolución de salida: ningún vértice se mueve más de simplify_px
+    # (los bounds originales se mantienen para colocar cada mancha en su celda)
+    if simplify_px > 0:
+        geoms_arr = shapely.simplify(geoms_arr, tolerance=simplify_px / global_scale, preserve_topology=True)
+
+    # Solo Polygon (3) / MultiPolygon (6) no vacíos; el resto deja su celda en blanco
+    type_ids = shapely.get_type_id(geoms_arr)
+    drawable = np.flatnonzero(~shapely.is_empty(geoms_arr) & ((type_ids == 3) | (type_ids == 6)))
+
     # cutoff: 2025-08-08 00:00:00Z
     cutoff_dt_utc = datetime(2025, 8, 8, 0, 0, 0, tzinfo=timezone.utc)
 
-    for i, geom in enumerate(geoms):
-        if geom.is_empty:
-            continue
-
-        r, c = i // cols, i % cols
-        ox_cell = margin + c * cell + inner_pad
-        oy_cell = margin + r * cell + inner_pad
-        bounds = geom.bounds
-        scale = global_scale
-
-        # path (admite MultiPolygon)
-        if isinstance(geom, Polygon):
-            polys = [geom]
-        elif isinstance(geom, MultiPolygon):
-            polys = list(geom.geoms)
-        else:
-            mapped = mapping(geom)
-            if mapped.get("type") == "Polygon":
-                polys = [geom]
-            elif mapped.get("type") == "MultiPolygon":
-                polys = list(geom.geoms)
-            else:
-                continue
-
-        d_total = []
-        for poly in polys:
-            d_total.append(path_from_polygon(poly, ox_cell, oy_cell, scale, bounds, flip_y=True))
-
-        # color por reglas
-        fill = pick_color(gdf.iloc[i], cutoff_dt_utc)
-
-        path = dwg.path(
-            d=" ".join(d_total),
-            fill=fill,
-            stroke=stroke,
-            stroke_width=stroke_width,
-            fill_rule="evenodd",
-            style="vector-effect:non-scaling-stroke",
-        )
-        dwg.add(path)
-
-        if label:
-            rank = i + 1
-            mun = gdf.iloc[i].get("mun", "—")
-            prov = gdf.iloc[i].get("prov", "—")
-            ccaa = gdf.iloc[i].get("ccaa", "—")
-            fireyear = gdf.iloc[i].get("fireyear", "—")
-            ha = gdf.iloc[i].get("area_ha", "—")
-
-            # 5 líneas muy compactas
+    # color por reglas y columnas de etiqueta, precalculados una sola vez
+    colors = pick_colors(gdf, cutoff_dt_utc)
+
+    def label_values(name):
+        if name in gdf.columns:
+            return gdf[name].to_numpy()
+        return np.full(n, "—", dtype=object)
+
+    if label:
+        mun_arr = label_values("mun")
+        prov_arr = label_values("prov")
+        ccaa_arr = label_values("ccaa")
+        fireyear_arr = label_values("fireyear")
+        ha_arr = label_values("area_ha")
+
+    # Un <g fill=...> por clase de color (solo hay tres) en vez de fill por path
+    for color in dict.fromkeys(colors[drawable].tolist()):
+        buf.write(f'<g{svg_attrs(fill=color, **group_attrs)}>')
+        for i in drawable[colors[drawable] == color].tolist():
+            r, c = i // cols, i % cols
+            ox_cell = margin + c * cell + inner_pad
+            oy_cell = margin + r * cell + inner_pad
+            bounds = tuple(bounds_arr[i])
+            scale = global_scale
+
+            # path (admite MultiPolygon: todas sus partes en un único bloque)
+            d = path_from_polygon(geoms_arr[i], ox_cell, oy_cell, scale, bounds, flip_y=True)
+            buf.write(f'<path d="{d}" />')
+        buf.write("</g>")
+
+    # Etiquetas aparte, por encima de todas las manchas
+    if label:
+        dy = font_size * 1.2
+        for i in drawable.tolist():
+            r, c = i // cols, i % cols
+            ox_cell = margin + c * cell + inner_pad
+            oy_cell = margin + r * cell + inner_pad
             y0 = oy_cell + 2 + font_size
-            dy = font_size * 1.2
-
-            dwg.add(dwg.text(
-                f"{mun}",
-                insert=(ox_cell + 2, y0),
-                font_size=font_size,
-                font_family="MarcinAntB, sans-serif",
-                fill="#444"
-            ))
-            dwg.add(dwg.text(
-                f"{prov}",
-                insert=(ox_cell + 2, y0 + dy),
-                font_size=font_size,
-                font_family="MarcinAntB, sans-serif",
-                fill="#222"
-            ))
-            dwg.add(dwg.text(
-                f"{ha}",
-                insert=(ox_cell + 2, y0 + dy * 2),
-                font_size=font_size,
-                font_family="MarcinAntB, sans-serif",
-                fill="#222"
-            ))
-            dwg.add(dwg.text(
-                f"{ccaa}",
-                insert=(ox_cell + 2, y0 + dy * 3),
-                font_size=font_size,
-                font_family="MarcinAntB, sans-serif",
-                fill="#000"
-            ))
-            dwg.add(dwg.text(
-                f"{fireyear}",
-                insert=(ox_cell + 2, y0 + dy * 4),
-                font_size=font_size,
-                font_family="MarcinAntB, sans-serif",
-                fill="#000"
+            buf.write(LABEL_TPL.format(
+                attrs=text_attrs,
+                x=ox_cell + 2,
+                y0=y0, y1=y0 + dy, y2=y0 + dy * 2, y3=y0 + dy * 3, y4=y0 + dy * 4,
+                mun=escape(str(mun_arr[i])),
+                prov=escape(str(prov_arr[i])),
+                ha=escape(str(ha_arr[i])),
+                ccaa=escape(str(ccaa_arr[i])),
+                fireyear=escape(str(fireyear_arr[i])),
             ))
 
-    dwg.save()
+    buf.write("</svg>")
+    save_svg(buf, out_path, pretty=pretty)
     return width, height
 
 
 # ---------- main ----------
 
+# Únicas propiedades que usa el script; el resto ni se lee del GeoJSON
+READ_COLUMNS = ["firedate", "fireyear", "mun", "prov", "ccaa", "area_ha"]
+
+
+# Nombre esperado: ES_YYYY_fuegos.geojson
+ES_GEOJSON_RE = re.compile(r"ES_(\d{4})_fuegos\.geojson")
+
+
 def find_es_geojsons(data_dir: Path, min_year=2016):
     files = []
     for p in sorted(data_dir.glob("ES_*_fuegos.geojson")):
-        try:
-            # Nombre esperado: ES_YYYY_fuegos.geojson
-            year = int(p.name.split("_")[1])
-            if year >= min_year:
-                files.append((year, p))
-        except Exception:
-            continue
+        m = ES_GEOJSON_RE.fullmatch(p.name)
+        if m and int(m.group(1)) >= min_year:
+            files.append((int(m.group(1)), p))
     files.sort(key=lambda x: x[0])
     return files
 
 
+def read_year_geojson(year_file):
+    """Lee un (year, path) de find_es_geojsons y anota el año de origen."""
+    year, pathfile = year_file
+    gdf = pyogrio.read_dataframe(pathfile, columns=READ_COLUMNS)
+    gdf["__source_year"] = year  # por si hace falta
+    return gdf
+
+
 def main():
     ap = argparse.ArgumentParser(
         description="Small multiples (2016+) con escala real, filtrado por área y coloreado por reglas de fecha/año."
@@ -273,6 +345,9 @@ def main():
     ap.add_argument("--margin", type=int, default=24, help="Margen exterior en px")
     ap.add_argument("--stroke", type=float, default=0.0, help="Grosor del trazo px")
     ap.add_argument("--label", action="store_true", help="Pinta rank, mun, prov, ccaa, fireyear (tamaño pequeño)")
+    ap.add_argument("--simplify-px", type=float, default=0.5,
+                    help="Tolerancia de simplificación en px de salida (0 = sin simplificar)")
+    ap.add_argument("--pretty", action="store_true", help="SVG indentado y legible (más lento)")
     args = ap.parse_args()
 
     data_dir = Path(args.data)
@@ -283,36 +358,35 @@ def main():
     if not files:
         raise SystemExit(f"No se encontraron ES_YYYY_fuegos.geojson >= 2016 en {data_dir}")
 
-    # Leer y concatenar
-    gdfs = []
-    for year, pathfile in files:
-        gdf = gpd.read_file(pathfile)
-        if gdf.empty:
-            continue
-        gdf["__source_year"] = year  # por si hace falta
-        gdfs.append(gdf)
+    # Leer en paralelo (pyogrio suelta el GIL durante la lectura OGR) y concatenar
+    with ThreadPoolExecutor() as ex:
+        gdfs = [gdf for gdf in ex.map(read_year_geojson, files) if not gdf.empty]
 
     if not gdfs:
         raise SystemExit("No hay datos válidos en los ficheros encontrados.")
 
-    gdf_all = gpd.pd.concat(gdfs, ignore_index=True)
-    gdf_all = gdf_all.set_geometry(gdf_all.geometry.apply(make_valid))
+    gdf_all = gpd.pd.concat(gdfs, ignore_index=True, copy=False)
+    gdf_all = gdf_all.set_geometry(make_valid_array(gdf_all.geometry.values), crs=gdf_all.crs)
     gdf_all = ensure_crs_4326(gdf_all)
 
+    # Una sola reproyección (áreas + dibujo), y solo de lo que puede llegar al
+    # dibujo: lo que ya cumple min_ha según 'area_ha' y lo que no trae área
+    if "area_ha" in gdf_all.columns:
+        area_hint = gdf_all["area_ha"].astype(float)
+        gdf_all = gdf_all[area_hint.isna() | (area_hint >= float(args.min_ha))]
+    gdf_aea = to_crs_3035(gdf_all)
+
     # área final
-    gdf_all["area_ha_final"] = compute_area_ha(gdf_all, area_col_hint="area_ha")
+    gdf_aea["area_ha_final"] = compute_area_ha(gdf_aea, area_col_hint="area_ha")
 
     # filtro por área (excluye < min_ha)
-    gdf_big = gdf_all[gdf_all["area_ha_final"] >= float(args.min_ha)].copy()
-    if gdf_big.empty:
+    gdf_aea = gdf_aea[gdf_aea["area_ha_final"] >= float(args.min_ha)].copy()
+    if gdf_aea.empty:
         raise SystemExit(f"No hay incendios con area_ha >= {args.min_ha} ha.")
 
     # ordenar desc por área
-    gdf_big.sort_values("area_ha_final", ascending=False, inplace=True)
-    gdf_big.reset_index(drop=True, inplace=True)
-
-    # proyección para dibujar
-    gdf_aea = gdf_big.to_crs(3035)
+    gdf_aea.sort_values("area_ha_final", ascending=False, inplace=True)
+    gdf_aea.reset_index(drop=True, inplace=True)
 
     # dibujar
     w, h = draw_geoms_to_svg_scaled(
@@ -324,6 +398,8 @@ def main():
         stroke_width=args.stroke,
         label=args.label,
         font_size=7,
+        simplify_px=args.simplify_px,
+        pretty=args.pretty,
     )
 
     print(f"SVG escrito en: {out}  ({int(w)}×{int(h)} px)")
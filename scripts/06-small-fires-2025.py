@@ -2,15 +2,18 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import io
 import math
 from pathlib import Path
 from datetime import datetime, timezone
+from xml.sax.saxutils import escape, quoteattr
 
 import geopandas as gpd
+import numpy as np
 import pandas as pd
+import shapely
+from pyproj import Transformer
 from shapely.validation import make_valid as _make_valid
-from shapely.geometry import Polygon, MultiPolygon, mapping
-import svgwrite
 
 
 # ---------- util geom ----------
@@ -25,26 +28,64 @@ def make_valid(geom):
             return geom
 
 
+def make_valid_array(geoms):
+    """
+    make_valid vectorizado (shapely 2), solo sobre las geometrías no válidas;
+    si falla, cae a make_valid geometría a geometría.
+    """
+    geoms = np.array(geoms, dtype=object)  # copia: no tocamos el array original
+    invalid = ~shapely.is_valid(geoms)
+    if invalid.any():
+        try:
+            geoms[invalid] = shapely.make_valid(geoms[invalid])
+        except Exception:
+            geoms[invalid] = [make_valid(g) for g in geoms[invalid]]
+    return geoms
+
+
 def ensure_crs_4326(gdf):
     """Si el GeoDataFrame no tiene CRS, asumimos EPSG:4326 (GeoJSON por defecto)."""
     return gdf.set_crs(4326) if gdf.crs is None else gdf
 
 
-def compute_area_ha(gdf, area_col_hint="area_ha"):
+# Transformers cacheados por (CRS origen, CRS destino): cada uno se construye una vez
+_TRANSFORMERS = {}
+
+
+def _xf(src, dst):
+    key = (src, dst)
+    if key not in _TRANSFORMERS:
+        _TRANSFORMERS[key] = Transformer.from_crs(src, dst, always_xy=True)
+    return _TRANSFORMERS[key]
+
+
+def reproject(geoms, src, dst):
+    """Reproyecta un array de geometrías con el Transformer cacheado (todas las coords de golpe)."""
+    t = _xf(src, dst)
+    return shapely.transform(geoms, lambda xy: np.column_stack(t.transform(xy[:, 0], xy[:, 1])))
+
+
+def to_crs_3035(gdf):
+    """GeoDataFrame completo a EPSG:3035 en una sola pasada (ver reproject)."""
+    gdf = ensure_crs_4326(gdf)
+    return gdf.set_geometry(reproject(gdf.geometry.to_numpy(), gdf.crs, 3035), crs=3035)
+
+
+def compute_area_ha(gdf_aea, area_col_hint="area_ha"):
     """
     Devuelve serie de área en hectáreas, usando el campo 'area_ha' si existe y es válido.
-    Si faltan algunos valores, calcula en EPSG:3035 (LAEA Europe).
+    Si faltan algunos valores, los mide sobre la geometría, que ya debe venir en
+    EPSG:3035 (LAEA Europe; ver to_crs_3035), sin volver a reproyectar.
     """
-    gdf = ensure_crs_4326(gdf)
-    if area_col_hint in gdf.columns and gdf[area_col_hint].notna().any():
-        out = gdf[area_col_hint].copy()
+    if area_col_hint in gdf_aea.columns and gdf_aea[area_col_hint].notna().any():
+        out = gdf_aea[area_col_hint].copy()
         missing = out.isna()
         if missing.any():
-            aea = (gdf.loc[missing].to_crs(3035).geometry.area / 10_000.0)
-            out.loc[missing] = aea
+            out.loc[missing] = shapely.area(gdf_aea.geometry.values[missing.to_numpy()]) / 10_000.0
         return out.astype(float)
     else:
-        return (gdf.to_crs(3035).geometry.area / 10_000.0).astype(float)
+        areas = shapely.area(gdf_aea.geometry.values) / 10_000.0
+        return pd.Series(areas, index=gdf_aea.index, dtype=float)
 
 
 # ---------- helpers de formato/fechas ----------
@@ -82,17 +123,9 @@ def firedate_show_es(dt: datetime) -> str:
     mes = MESES_ES[dt.month - 1]
     return f"{dia} de {mes}"
 
-def parse_firedate(val):
-    """Devuelve datetime con tz UTC si hay valor ISO; None si no es parseable."""
-    if val is None or val == "":
-        return None
-    try:
-        ts = pd.to_datetime(val, utc=True)
-        if pd.isna(ts):
-            return None
-        return ts.to_pydatetime()
-    except Exception:
-        return None
+def parse_firedates(values):
+    """Fechas ISO -> serie tz UTC (vectorizado); NaT si no es parseable."""
+    return pd.to_datetime(values, utc=True, errors="coerce", format="ISO8601")
 
 def safe_int(val, default=None):
     try:
@@ -105,36 +138,82 @@ def safe_int(val, default=None):
 
 # ---------- svg helpers ----------
 
-def path_from_polygon(poly: Polygon, ox: float, oy: float, scale: float,
+def path_from_polygon(poly, ox: float, oy: float, scale: float,
                       bounds: tuple, flip_y=True, precision=2) -> str:
+    """
+    Path SVG de un Polygon o MultiPolygon (todas sus partes y huecos). La
+    transformación y el formato se hacen con arrays NumPy sobre todos los
+    anillos a la vez. Las coordenadas salen en punto fijo: enteros en unidades
+    de 10**-precision px, así que el <path> debe llevar scale(...) (ver path_scale).
+    """
     minx, miny, maxx, maxy = bounds
+    q = 10 ** precision
 
-    def fmt(x): return f"{x:.{precision}f}"
+    rings = shapely.get_rings(shapely.get_parts(poly))
+    counts = shapely.get_num_coordinates(rings)
+    rings, counts = rings[counts > 0], counts[counts > 0]
+    if len(rings) == 0:
+        return ""
+    xy = shapely.get_coordinates(rings)  # (n, 2), anillos seguidos
 
-    def transform(x, y):
-        X = (x - minx) * scale + ox
-        Yraw = (y - miny) * scale + oy
-        return (X, (oy + (maxy - miny) * scale - (Yraw - oy)) if flip_y else Yraw)
+    X = (xy[:, 0] - minx) * scale + ox
+    Yraw = (xy[:, 1] - miny) * scale + oy
+    Y = (oy + (maxy - miny) * scale - (Yraw - oy)) if flip_y else Yraw
 
-    def ring_to_cmds(coords):
-        cmds, first = [], True
-        for (x, y) in coords:
-            X, Y = transform(x, y)
-            cmds.append(("M" if first else "L", X, Y))
-            first = False
-        cmds.append(("Z", None, None))
-        return cmds
+    # "M" al empezar cada anillo, "L" en el resto y " Z" tras su último vértice
+    ends = np.cumsum(counts)
+    cmds = np.full(len(xy), "L ")
+    cmds[ends - counts] = "M "
+    closes = np.full(len(xy), "", dtype="<U2")
+    closes[ends - 1] = " Z"
 
-    d_parts = []
-    ext = list(poly.exterior.coords)
-    for cmd, X, Y in ring_to_cmds(ext):
-        d_parts.append("Z" if cmd == "Z" else f"{cmd} {fmt(X)} {fmt(Y)}")
+    # int -> str se hace en C; mucho más barato que "%.2f" por coordenada
+    Xs = np.rint(X * q).astype(np.int64).astype(str)
+    Ys = np.rint(Y * q).astype(np.int64).astype(str)
+    pts = np.char.add(np.char.add(Xs, " "), Ys)
+    return " ".join(np.char.add(np.char.add(cmds, pts), closes).tolist())
 
-    for hole in poly.interiors:
-        for cmd, X, Y in ring_to_cmds(list(hole.coords)):
-            d_parts.append("Z" if cmd == "Z" else f"{cmd} {fmt(X)} {fmt(Y)}")
 
-    return " ".join(d_parts)
+def path_scale(precision=2):
+    """transform que deshace el punto fijo de path_from_polygon."""
+    return f"scale({10 ** -precision})"
+
+
+def path_stroke_width(stroke_width, precision=2):
+    """stroke-width en las mismas unidades de punto fijo que el path: path_scale lo
+    devuelve a px sin depender de vector-effect (CairoSVG no lo soporta)."""
+    return f"{stroke_width * 10 ** precision:g}"
+
+
+SVG_HEADER = (
+    '<?xml version="1.0" encoding="utf-8" ?>\n'
+    '<svg baseProfile="full" height="{height}" version="1.1" width="{width}" '
+    'xmlns="http://www.w3.org/2000/svg" xmlns:ev="http://www.w3.org/2001/xml-events" '
+    'xmlns:xlink="http://www.w3.org/1999/xlink"><defs />'
+)
+
+
+def svg_attrs(**attrs):
+    """Atributos como texto (fill_rule -> fill-rule); omite vacíos, igual que svgwrite."""
+    return "".join(
+        f" {k.replace('_', '-')}={quoteattr(str(v))}"
+        for k, v in attrs.items() if v is not None and v != ""
+    )
+
+
+def save_svg(buf: io.StringIO, out_path: Path, pretty=False):
+    """Vuelca el buffer a disco. Con pretty=True indenta como svgwrite (más lento)."""
+    svg = buf.getvalue()
+    if pretty:
+        from svgwrite.utils import pretty_xml
+        head, body = svg.split("\n", 1)
+        svg = head + "\n" + pretty_xml(body)
+    out_path.write_text(svg, encoding="utf-8")
+
+
+def save_empty_svg(out_path: Path, width, height):
+    """SVG vacío mínimo (mismo marcado que un svgwrite.Drawing sin elementos)."""
+    out_path.write_text(SVG_HEADER.format(width=width, height=height) + "</svg>", encoding="utf-8")
 
 
 # ---------- colores (solo dos categorías para 2025) ----------
@@ -142,24 +221,36 @@ def path_from_polygon(poly: Polygon, ox: float, oy: float, scale: float,
 COLOR_ROSA = "#fac4c5"     # Antes del 8 de agosto
 COLOR_GRANATE = "#a80127"  # Desde el 8 de agosto (incluido)
 
-def pick_color_2025(row, cutoff_dt_utc):
+COLORS_2025 = np.array([COLOR_ROSA, COLOR_GRANATE])  # indexado por es_granate
+
+def granate_flags(gdf, cutoff_dt_utc):
     """
     Solo dos reglas:
       - firedate >= 2025-08-08 → GRANATE
       - firedate  < 2025-08-08 → ROSA
     Si no hay fecha, cae en ROSA por seguridad.
+    Vectorizado: devuelve un array bool (True=granate).
     """
-    fd = parse_firedate(row.get("firedate"))
-    if fd is not None:
-        if fd.tzinfo is None:
-            fd = fd.replace(tzinfo=timezone.utc)
-        if fd >= cutoff_dt_utc:
-            return COLOR_GRANATE
-    return COLOR_ROSA
+    if "firedate" in gdf.columns:
+        raw = gdf["firedate"]
+    else:
+        raw = pd.Series(None, index=gdf.index, dtype=object)
+    return (parse_firedates(raw) >= cutoff_dt_utc).to_numpy(dtype=bool)
 
 
 # ---------- draw (SVG gigante) ----------
 
+# Una etiqueta = un <text> con la fuente compartida y una línea por <tspan>
+LABEL_TPL = (
+    '<text{attrs} x="{x}" y="{y0}">'
+    '<tspan fill="#444">{mun}</tspan>'
+    '<tspan fill="#222" x="{x}" dy="{dy}">{prov}</tspan>'
+    '<tspan fill="#222" x="{x}" dy="{dy}">{ha} ha</tspan>'
+    '<tspan fill="#000" x="{x}" dy="{dy}">{ccaa}</tspan>'
+    '<tspan fill="#000" x="{x}" dy="{dy}">{fireyear}</tspan>'
+    '</text>'
+)
+
 def draw_geoms_to_svg_scaled(
     gdf,
     out_path: Path,
@@ -170,12 +261,17 @@ def draw_geoms_to_svg_scaled(
     stroke_width=0,
     label=False,
     font_size=7,
-    cutoff_dt_utc=None
+    cutoff_dt_utc=None,
+    simplify_px=0.5,
+    pretty=False,
+    shape_cache=None,
 ):
     """
     Dibuja geometrías con escala GLOBAL (comparables en área), en rejilla.
     Colorea cada feature con la regla 2025 (granate/rosa por fecha).
     Etiqueta (opcional): mun, prov, ha, ccaa, fireyear.
+    shape_cache: dict compartido entre llamadas con los 'd' ya formateados,
+    por (índice de fila, escala); la celda se aplica con transform=translate.
     """
     geoms = list(gdf.geometry)
     n = len(geoms)
@@ -185,109 +281,101 @@ def draw_geoms_to_svg_scaled(
 
     width = margin * 2 + cols * cell
     height = margin * 2 + rows * cell
-    dwg = svgwrite.Drawing(str(out_path), size=(width, height), profile="full")
+    buf = io.StringIO()
+    buf.write(SVG_HEADER.format(width=width, height=height))
+    # stroke-width en unidades de punto fijo, como el 'd' (ambos bajo el mismo scale)
+    path_attrs = svg_attrs(
+        stroke=stroke,
+        stroke_width=path_stroke_width(stroke_width),
+    )
+    text_attrs = svg_attrs(font_family="MarcinAntB, sans-serif", font_size=font_size)
 
     inner_pad = 4
     inner = cell - inner_pad * 2
 
-    # Escala global a partir de todas las geometrías
-    max_w = max(g.bounds[2] - g.bounds[0] for g in geoms if not g.is_empty)
-    max_h = max(g.bounds[3] - g.bounds[1] for g in geoms if not g.is_empty)
+    # Escala global a partir de todas las geometrías (bounds en un solo paso vectorizado)
+    geoms_arr = np.asarray(geoms, dtype=object)
+    bounds_arr = shapely.bounds(geoms_arr)  # (n, 4), NaN si vacía
+    nonempty = ~shapely.is_empty(geoms_arr)
+    wh = bounds_arr[nonempty, 2:4] - bounds_arr[nonempty, 0:2]  # (n, 2): ancho, alto
+    max_w, max_h = wh.max(axis=0)
     global_scale = min(inner / max_w, inner / max_h) if max_w > 0 and max_h > 0 else 1.0
 
+    # Douglas-Peucker a resolución de salida: ningún vértice se mueve más de simplify_px
+    # (los bounds originales se mantienen para colocar cada mancha en su celda).
+    # Si alguna mancha diminuta colapsa a vacío, se dibuja la original
+    if simplify_px > 0:
+        simpl = shapely.simplify(geoms_arr, tolerance=simplify_px / global_scale, preserve_topology=True)
+        collapsed = shapely.is_empty(simpl) & nonempty
+        geoms_arr = np.where(collapsed, geoms_arr, simpl)
+
+    # Solo Polygon (3) / MultiPolygon (6) no vacíos; el resto deja su celda en blanco
+    type_ids = shapely.get_type_id(geoms_arr)
+    drawable = np.flatnonzero(nonempty & ((type_ids == 3) | (type_ids == 6)))
+
     # cutoff fijo: 2025-08-08 00:00:00Z (si no viene de fuera)
     if cutoff_dt_utc is None:
         cutoff_dt_utc = datetime(2025, 8, 8, 0, 0, 0, tzinfo=timezone.utc)
 
-    for i, geom in enumerate(geoms):
-        if geom.is_empty:
-            continue
-
+    # color 2-categorías 2025: columna _gran precalculada en main o, si no viene, en bloque aquí
+    if "_gran" in gdf.columns:
+        gran = gdf["_gran"].to_numpy(dtype=bool)
+    else:
+        gran = granate_flags(gdf, cutoff_dt_utc)
+    colors = COLORS_2025[gran.astype(np.intp)]
+
+    # columnas de etiqueta como arrays, una sola vez (sin Series por fila)
+    def label_values(name):
+        if name in gdf.columns:
+            return gdf[name].to_numpy()
+        return np.full(n, "—", dtype=object)
+
+    if label:
+        mun_arr = label_values("mun")
+        prov_arr = label_values("prov")
+        ccaa_arr = label_values("ccaa")
+        fireyear_arr = label_values("fireyear")
+        ha_arr = label_values("area_ha_final")
+
+    if shape_cache is None:
+        shape_cache = {}
+    fixed_scale = path_scale()
+    row_keys = gdf.index.tolist()
+
+    for i in drawable.tolist():
         r, c = i // cols, i % cols
         ox_cell = margin + c * cell + inner_pad
         oy_cell = margin + r * cell + inner_pad
 
-        # path (admite MultiPolygon)
-        if isinstance(geom, Polygon):
-            polys = [geom]
-        elif isinstance(geom, MultiPolygon):
-            polys = list(geom.geoms)
-        else:
-            mapped = mapping(geom)
-            if mapped.get("type") == "Polygon":
-                polys = [geom]
-            elif mapped.get("type") == "MultiPolygon":
-                polys = list(geom.geoms)
-            else:
-                continue
-
-        bounds = geom.bounds
-        d_total = []
-        for poly in polys:
-            d_total.append(
-                path_from_polygon(poly, ox_cell, oy_cell, global_scale, bounds, flip_y=True)
+        # path relativo a su celda (admite MultiPolygon: todas sus partes en un único bloque).
+        # Solo depende de la geometría y la escala: si otro SVG ya lo generó, se reutiliza
+        key = (row_keys[i], global_scale)
+        d = shape_cache.get(key)
+        if d is None:
+            bounds = tuple(bounds_arr[i])
+            d = shape_cache[key] = path_from_polygon(geoms_arr[i], 0, 0, global_scale, bounds, flip_y=True)
+
+        if d:  # sin anillos no hay nada que pintar (ni d="Z")
+            buf.write(
+                f'<path d="{d}" fill="{colors[i]}" fill-rule="evenodd"{path_attrs}'
+                f' transform="translate({ox_cell} {oy_cell}) {fixed_scale}" />'
             )
 
-        # color 2-categorías 2025
-        fill = pick_color_2025(gdf.iloc[i], cutoff_dt_utc)
-
-        path = dwg.path(
-            d=" ".join(d_total),
-            fill=fill,
-            stroke=stroke,
-            stroke_width=stroke_width,
-            fill_rule="evenodd",
-            style="vector-effect:non-scaling-stroke",
-        )
-        dwg.add(path)
-
         if label:
-            mun = gdf.iloc[i].get("mun", "—")
-            prov = gdf.iloc[i].get("prov", "—")
-            ccaa = gdf.iloc[i].get("ccaa", "—")
-            fireyear = gdf.iloc[i].get("fireyear", "—")
-            ha = gdf.iloc[i].get("area_ha_final", "—")
-
-            y0 = oy_cell + 2 + font_size
-            dy = font_size * 1.2
-
-            dwg.add(dwg.text(
-                f"{mun}",
-                insert=(ox_cell + 2, y0),
-                font_size=font_size,
-                font_family="MarcinAntB, sans-serif",
-                fill="#444"
-            ))
-            dwg.add(dwg.text(
-                f"{prov}",
-                insert=(ox_cell + 2, y0 + dy),
-                font_size=font_size,
-                font_family="MarcinAntB, sans-serif",
-                fill="#222"
-            ))
-            dwg.add(dwg.text(
-                f"{format_es_number(ha, 0)} ha",
-                insert=(ox_cell + 2, y0 + dy * 2),
-                font_size=font_size,
-                font_family="MarcinAntB, sans-serif",
-                fill="#222"
-            ))
-            dwg.add(dwg.text(
-                f"{ccaa}",
-                insert=(ox_cell + 2, y0 + dy * 3),
-                font_size=font_size,
-                font_family="MarcinAntB, sans-serif",
-                fill="#000"
-            ))
-            dwg.add(dwg.text(
-                f"{fireyear}",
-                insert=(ox_cell + 2, y0 + dy * 4),
-                font_size=font_size,
-                font_family="MarcinAntB, sans-serif",
-                fill="#000"
+            buf.write(LABEL_TPL.format(
+                attrs=text_attrs,
+                x=ox_cell + 2,
+                y0=oy_cell + 2 + font_size,
+                dy=font_size * 1.2,
+                mun=escape(str(mun_arr[i])),
+                prov=escape(str(prov_arr[i])),
+                ha=format_es_number(ha_arr[i], 0),
+                ccaa=escape(str(ccaa_arr[i])),
+                fireyear=escape(str(fireyear_arr[i])),
             ))
 
-    dwg.save()
+    buf.write("</svg>")
+    save_svg(buf, out_path, pretty=pretty)
     return width, height
 
 
@@ -317,6 +405,9 @@ def main():
     ap.add_argument("--margin", type=int, default=24, help="Margen exterior en px")
     ap.add_argument("--stroke", type=float, default=0.0, help="Grosor del trazo px")
     ap.add_argument("--label", action="store_true", help="Pinta etiquetas pequeñas (mun, prov, ha, ccaa, fireyear)")
+    ap.add_argument("--simplify-px", type=float, default=0.5,
+                    help="Tolerancia de simplificación en px de salida (0 = sin simplificar)")
+    ap.add_argument("--pretty", action="store_true", help="SVG indentado y legible (más lento)")
     args = ap.parse_args()
 
     data_dir = Path(args.data)
@@ -343,27 +434,34 @@ def main():
         raise SystemExit("El GeoJSON de 2025 no tiene datos.")
 
     # Geometrías válidas y CRS
-    gdf = gdf.set_geometry(gdf.geometry.apply(make_valid))
+    gdf = gdf.set_geometry(make_valid_array(gdf.geometry.values), crs=gdf.crs)
     gdf = ensure_crs_4326(gdf)
 
+    # Una sola reproyección a métrica (3035): sirve para el área y para dibujar
+    # proporciones reales; los subconjuntos salen de aquí sin reproyectar
+    gdf_aea = to_crs_3035(gdf)
+
     # Área final para ordenar
-    gdf["area_ha_final"] = compute_area_ha(gdf, area_col_hint="area_ha")
+    gdf_aea["area_ha_final"] = compute_area_ha(gdf_aea, area_col_hint="area_ha")
 
     # Filtro por área (opcional)
-    gdf = gdf[gdf["area_ha_final"] >= float(args.min_ha)].copy()
-    if gdf.empty:
+    gdf_aea = gdf_aea[gdf_aea["area_ha_final"] >= float(args.min_ha)].copy()
+    if gdf_aea.empty:
         raise SystemExit(f"No hay incendios con area_ha >= {args.min_ha} ha en 2025.")
 
     # Orden global por hectáreas (desc)
-    gdf.sort_values("area_ha_final", ascending=False, inplace=True)
-    gdf.reset_index(drop=True, inplace=True)
-
-    # Pasar a proyección métrica para dibujar proporciones reales
-    gdf_aea = gdf.to_crs(3035)
+    gdf_aea.sort_values("area_ha_final", ascending=False, inplace=True)
+    gdf_aea.reset_index(drop=True, inplace=True)
 
     # cutoff: 2025-08-08 00:00:00Z
     cutoff_dt_utc = datetime(2025, 8, 8, 0, 0, 0, tzinfo=timezone.utc)
 
+    # firedate parseado una sola vez para todo el frame; los subsets heredan la columna
+    gdf_aea["_gran"] = granate_flags(gdf_aea, cutoff_dt_utc)
+
+    # paths ya formateados, compartidos por los tres SVG (los subsets conservan el índice)
+    shape_cache = {}
+
     # SVG grande con TODOS
     w_all, h_all = draw_geoms_to_svg_scaled(
         gdf_aea,
@@ -375,26 +473,19 @@ def main():
         label=args.label,
         font_size=7,
         cutoff_dt_utc=cutoff_dt_utc,
+        simplify_px=args.simplify_px,
+        pretty=args.pretty,
+        shape_cache=shape_cache,
     )
 
-    # Subconjuntos para dos SVGs extra
-    def is_granate(row):
-        fd = parse_firedate(row.get("firedate"))
-        if fd is None:
-            return False
-        if fd.tzinfo is None:
-            fd = fd.replace(tzinfo=timezone.utc)
-        return fd >= cutoff_dt_utc
-
-    mask_gran = gdf.apply(is_granate, axis=1)
-    gdf_gran = gdf.loc[mask_gran].copy()
-    gdf_rosa = gdf.loc[~mask_gran].copy()
+    # Subconjuntos para dos SVGs extra (máscara booleana ya calculada; sin fecha → rosa)
+    mask_gran = gdf_aea["_gran"].to_numpy(dtype=bool)
+    gdf_gran = gdf_aea.loc[mask_gran].copy()
+    gdf_rosa = gdf_aea.loc[~mask_gran].copy()
 
     # Mantener el orden por área en cada subset
     gdf_gran.sort_values("area_ha_final", ascending=False, inplace=True)
-    gdf_gran = gdf_gran.to_crs(3035)
     gdf_rosa.sort_values("area_ha_final", ascending=False, inplace=True)
-    gdf_rosa = gdf_rosa.to_crs(3035)
 
     # SVG solo granates
     if len(gdf_gran) > 0:
@@ -408,10 +499,13 @@ def main():
             label=args.label,
             font_size=7,
             cutoff_dt_utc=cutoff_dt_utc,
+            simplify_px=args.simplify_px,
+            pretty=args.pretty,
+            shape_cache=shape_cache,
         )
     else:
         # crear SVG vacío mínimo para no romper pipes
-        svgwrite.Drawing(str(out_gran), size=(args.margin*2+args.cell, args.margin*2+args.cell)).save()
+        save_empty_svg(out_gran, args.margin*2+args.cell, args.margin*2+args.cell)
 
     # SVG solo rosas
     if len(gdf_rosa) > 0:
@@ -425,9 +519,12 @@ def main():
             label=args.label,
             font_size=7,
             cutoff_dt_utc=cutoff_dt_utc,
+            simplify_px=args.simplify_px,
+            pretty=args.pretty,
+            shape_cache=shape_cache,
         )
     else:
-        svgwrite.Drawing(str(out_rosa), size=(args.margin*2+args.cell, args.margin*2+args.cell)).save()
+        save_empty_svg(out_rosa, args.margin*2+args.cell, args.margin*2+args.cell)
 
     print(f"[OK] SVG TODOS: {out_all}  ({int(w_all)}×{int(h_all)} px)")
     print(f"[OK] SVG GRANATES (>= 2025-08-08): {out_gran}")
@@ -3,9 +3,12 @@
 
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from typing import List
 import geopandas as gpd
 import pandas as pd
+import pyogrio
+from pyproj import CRS
 
 TASKS = [
     {
@@ -33,6 +36,10 @@ TASKS = [
 
 TARGET_EPSG = 4326  # WGS84 lon/lat
 
+# Atributos que se conservan de los recintos INSPIRE (los scripts 05/11/12/13 solo
+# usan NAMEUNIT); el resto ni se lee del SHP. Los que no existan se ignoran.
+READ_COLUMNS = ["NATCODE", "NAMEUNIT"]
+
 
 def check_exists(path: str) -> None:
     if not os.path.exists(path):
@@ -42,14 +49,16 @@ def check_exists(path: str) -> None:
 def load_and_to_crs(path: str, epsg: int) -> gpd.GeoDataFrame:
     """Carga un SHP y reproyecta a EPSG indicado. Falla si el CRS de origen no está definido."""
     check_exists(path)
-    gdf = gpd.read_file(path)
+    gdf = pyogrio.read_dataframe(path, columns=READ_COLUMNS)
     if gdf.crs is None:
         raise ValueError(
             f"El shapefile no tiene CRS definido: {path}\n"
             f"Solución: asígnale su CRS original (por ej. gdf.set_crs('EPSG:25830', inplace=True)) y vuelve a ejecutar."
         )
-    if gdf.crs.to_epsg() != epsg:
-        gdf = gdf.to_crs(epsg=epsg)
+    # equals() es una comparación directa; to_epsg() solo si el CRS viene escrito de otra forma
+    target = CRS.from_epsg(epsg)
+    if not (gdf.crs.equals(target, ignore_axis_order=True) or gdf.crs.to_epsg() == epsg):
+        gdf = gdf.to_crs(target)
     return gdf
 
 
@@ -78,19 +87,25 @@ def merge_and_export(inputs: List[str], output: str, epsg: int = TARGET_EPSG) ->
 
     gdfs = align_columns(gdfs)
 
-    merged = gpd.GeoDataFrame(pd.concat(gdfs, ignore_index=True), crs=f"EPSG:{epsg}")
+    merged = gpd.GeoDataFrame(pd.concat(gdfs, ignore_index=True, copy=False), crs=f"EPSG:{epsg}")
 
     # Carpeta salida
     os.makedirs(os.path.dirname(output), exist_ok=True)
 
     # Exportar GeoJSON (sin índice)
-    merged.to_file(output, driver="GeoJSON")
+    merged.to_file(output, driver="GeoJSON", engine="pyogrio")
     print(f"   Guardado: {output} | total features: {len(merged)} | CRS: EPSG:{epsg}")
 
 
+def _run_task(task: dict) -> None:
+    merge_and_export(task["inputs"], task["output"], TARGET_EPSG)
+
+
 def main():
-    for task in TASKS:
-        merge_and_export(task["inputs"], task["output"], TARGET_EPSG)
+    # Las tres tareas son independientes: una por proceso (cada uno con su GDAL/PROJ)
+    workers = min(len(TASKS), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        list(ex.map(_run_task, TASKS))
     print(">>> Todo terminado ✅")
 
 
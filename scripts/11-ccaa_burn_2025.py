@@ -4,8 +4,11 @@
 import os
 import json
 import math
+import numpy as np
 import pandas as pd
 import geopandas as gpd
+import shapely
+from pyproj import Transformer
 from shapely.geometry import Polygon, MultiPolygon
 
 # --- CONFIG ---
@@ -18,27 +21,49 @@ SHEET_NAME = "autonomías 2025"                                   # nombre de la
 # EPSG de cálculo de áreas (Europa LAEA, buena para España)
 AREA_EPSG = 3035
 
+# Campos de área admitidos en los fuegos (por orden de preferencia); el resto ni se lee
+AREA_FIELDS = ["area_ha", "AREA_HA", "areaHA", "area", "ha"]
+
 # --- UTILS ---
 def ensure_dir(path: str):
     os.makedirs(os.path.dirname(path), exist_ok=True)
 
 def safe_make_valid(gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
-    # Arregla geometrías no válidas (buffer(0) estilo shapely)
+    # Arregla geometrías no válidas (shapely.make_valid vectorizado; buffer(0) puede perder partes)
     gdf = gdf.copy()
-    gdf["geometry"] = gdf["geometry"].buffer(0)
+    gdf["geometry"] = gpd.GeoSeries(
+        shapely.make_valid(gdf.geometry.to_numpy()), index=gdf.index, crs=gdf.crs
+    )
     return gdf
 
+# Transformers cacheados por (CRS origen, CRS destino): cada uno se construye una vez
+_TRANSFORMERS = {}
+
+def _xf(src, dst):
+    key = (src, dst)
+    if key not in _TRANSFORMERS:
+        _TRANSFORMERS[key] = Transformer.from_crs(src, dst, always_xy=True)
+    return _TRANSFORMERS[key]
+
+def reproject(geoms, src, dst):
+    """Reproyecta un array de geometrías con el Transformer cacheado (todas las coords de golpe)."""
+    t = _xf(src, dst)
+    return shapely.transform(geoms, lambda xy: np.column_stack(t.transform(xy[:, 0], xy[:, 1])))
+
+def to_area_crs(gdf: gpd.GeoDataFrame, epsg=AREA_EPSG) -> gpd.GeoDataFrame:
+    """Equivale a gdf.to_crs(epsg=epsg), vía reproject."""
+    return gdf.set_geometry(reproject(gdf.geometry.to_numpy(), gdf.crs, epsg), crs=epsg)
+
 def add_area_ha(gdf_ll: gpd.GeoDataFrame, epsg_area=AREA_EPSG, out_col="area_ha_geom"):
     """Añade columna de área en hectáreas calculada geométricamente reproyectando a epsg_area."""
-    gdf_m = gdf_ll.to_crs(epsg=epsg_area)
-    areas = gdf_m.geometry.area / 10000.0  # m² -> ha
-    gdf_ll[out_col] = areas.values
+    areas = shapely.area(reproject(gdf_ll.geometry.to_numpy(), gdf_ll.crs, epsg_area)) / 10000.0  # m² -> ha
+    gdf_ll[out_col] = areas
     return gdf_ll
 
 def filter_fires_min_ha(fires: gpd.GeoDataFrame, min_ha=30.0):
     # Si existe 'area_ha', la utilizamos; si no, calculamos
     area_field = None
-    for cand in ["area_ha", "AREA_HA", "areaHA", "area", "ha"]:
+    for cand in AREA_FIELDS:
         if cand in fires.columns:
             area_field = cand
             break
@@ -49,15 +74,39 @@ def filter_fires_min_ha(fires: gpd.GeoDataFrame, min_ha=30.0):
 
     return fires[fires[area_field] >= min_ha].copy()
 
+def burn_ha_by_unit(units_m: gpd.GeoDataFrame, fires_m: gpd.GeoDataFrame) -> dict:
+    """
+    Hectáreas quemadas por NAMEUNIT (ambos en CRS métrico). Filtro-refinado con
+    STRtree: solo se intersecan los fuegos cuyo bbox toca cada unidad. Las
+    unidades pueden venir en varias filas (partes sin disolver): se acumulan.
+    Los fuegos contenidos del todo en la unidad suman su área sin intersecar;
+    solo los que cruzan el borde pasan por shapely.intersection.
+    """
+    fire_geoms = fires_m.geometry.to_numpy()
+    unit_geoms = units_m.geometry.to_numpy()
+    shapely.prepare(unit_geoms)  # acelera contains sobre muchas candidatas
+
+    # Todos los pares (unidad, fuego) que se tocan, en una sola consulta al árbol
+    tree = shapely.STRtree(fire_geoms)
+    unit_idx, fire_idx = tree.query(unit_geoms, predicate="intersects")
+
+    units, fires = unit_geoms[unit_idx], fire_geoms[fire_idx]
+    m2 = shapely.area(fires)
+    border = ~shapely.contains(units, fires)
+    m2[border] = shapely.area(shapely.intersection(units[border], fires[border]))
+
+    names = units_m["NAMEUNIT"].to_numpy()[unit_idx]
+    return pd.Series(m2 / 10000.0).groupby(names).sum().to_dict()  # m² -> ha
+
 # --- MAIN ---
 def main():
-    # 1) Cargar autonomías y disolver por NAMEUNIT
+    # 1) Cargar autonomías
     if not os.path.exists(AUTONOMIAS_PATH):
         raise FileNotFoundError(f"No existe {AUTONOMIAS_PATH}")
     if not os.path.exists(FIRES_2025_PATH):
         raise FileNotFoundError(f"No existe {FIRES_2025_PATH}")
 
-    ccaa = gpd.read_file(AUTONOMIAS_PATH)
+    ccaa = gpd.read_file(AUTONOMIAS_PATH, engine="pyogrio", columns=["NAMEUNIT"])
     if "NAMEUNIT" not in ccaa.columns:
         raise ValueError("autonomias.geojson debe contener el campo 'NAMEUNIT'")
 
@@ -66,15 +115,16 @@ def main():
         raise ValueError("autonomias.geojson no tiene CRS definido")
     ccaa = safe_make_valid(ccaa)
 
-    # Disolver por NAMEUNIT (por si hay multiparte/islas)
-    ccaa_diss = ccaa.dissolve(by="NAMEUNIT", as_index=False)
-    ccaa_diss = safe_make_valid(ccaa_diss)
+    # Solo NAMEUNIT + geometría, ya en CRS métrico: sirve para el área total y para intersecar
+    ccaa_m = to_area_crs(ccaa[["NAMEUNIT", "geometry"]])
 
-    # Área total por autonomía (en ha)
-    ccaa_diss = add_area_ha(ccaa_diss, out_col="area_total_ha")
+    # Área total por autonomía (en ha): las partes de una misma NAMEUNIT (multiparte/islas)
+    # no se solapan, así que basta sumar sus áreas; no hace falta disolver geometrías
+    ccaa_m["area_total_ha"] = shapely.area(ccaa_m.geometry.to_numpy()) / 10000.0
+    surface_df = ccaa_m.groupby("NAMEUNIT", as_index=False)["area_total_ha"].sum()
 
     # 2) Cargar fuegos, filtrar ≥30 ha
-    fires = gpd.read_file(FIRES_2025_PATH)
+    fires = gpd.read_file(FIRES_2025_PATH, engine="pyogrio", columns=AREA_FIELDS)
     if fires.crs is None:
         raise ValueError("ES_2025_fuegos.geojson no tiene CRS definido")
     fires = safe_make_valid(fires)
@@ -82,23 +132,16 @@ def main():
     fires_big = safe_make_valid(fires_big)
 
     # 3) Intersección fuegos≥30ha × autonomías
-    #   Para medir áreas con precisión, hacemos overlay en un CRS métrico
-    ccaa_m = ccaa_diss.to_crs(epsg=AREA_EPSG)
-    fires_m = fires_big.to_crs(epsg=AREA_EPSG)
+    #   Para medir áreas con precisión, intersecamos en un CRS métrico (solo la geometría)
+    fires_m = to_area_crs(fires_big[["geometry"]])
 
-    inter = gpd.overlay(ccaa_m, fires_m, how="intersection", keep_geom_type=True)
-    # Área quemada en intersecciones (ha)
-    inter["burn_ha"] = inter.geometry.area / 10000.0
-
-    # 4) Agregado por autonomía (NAMEUNIT)
-    burn_by_ccaa = inter.groupby("NAMEUNIT", as_index=False)["burn_ha"].sum()
+    # 4) Área quemada por autonomía (NAMEUNIT), en ha
+    burn_by_ccaa = burn_ha_by_unit(ccaa_m, fires_m)
 
     # 5) Unir con superficies totales
-    #    Ojo: ccaa_m tiene la geometría en 3035; el área total está en ccaa_diss['area_total_ha'] (calculada ya)
-    #    Usamos el dataframe de atributos de ccaa_diss para coger area_total_ha.
-    surface_df = ccaa_diss[["NAMEUNIT", "area_total_ha"]].copy()
-
-    out = pd.merge(surface_df, burn_by_ccaa, on="NAMEUNIT", how="left").fillna({"burn_ha": 0.0})
+    #    El área total por NAMEUNIT ya está en surface_df (calculada en el paso 1)
+    out = surface_df.copy()
+    out["burn_ha"] = out["NAMEUNIT"].map(burn_by_ccaa).fillna(0.0)
     out["pct"] = (out["burn_ha"] / out["area_total_ha"]) * 100.0
     # Orden por % descendente, por ejemplo
     out = out.sort_values("pct", ascending=False).reset_index(drop=True)
@@ -107,19 +150,15 @@ def main():
     # Columnas solicitadas:
     # CCAA | Nombre autonomía | Superficie total (ha) | Superficie quemada (ha) | Porcentaje %
     header = ["CCAA", "Nombre autonomía", "Superficie total (ha)", "Superficie quemada (ha)", "Porcentaje %"]
-    rows = []
-    for _, r in out.iterrows():
-        name = r["NAMEUNIT"]
-        total = r["area_total_ha"]
-        burn = r["burn_ha"]
-        pct = r["pct"]
-        rows.append([
-            name,                     # CCAA
-            name,                     # Nombre autonomía (si quieres otra etiqueta, dime el campo)
-            f"{total:.2f}",
-            f"{burn:.2f}",
-            f"{pct:.2f}",
-        ])
+    # Formato por columnas (sin iterrows)
+    names = out["NAMEUNIT"].to_numpy().astype(str)
+    rows = np.column_stack([
+        names,                                                  # CCAA
+        names,                                                  # Nombre autonomía (si quieres otra etiqueta, dime el campo)
+        np.char.mod("%.2f", out["area_total_ha"].to_numpy()),
+        np.char.mod("%.2f", out["burn_ha"].to_numpy()),
+        np.char.mod("%.2f", out["pct"].to_numpy()),
+    ]).tolist()
 
     data_for_sheet = [header] + rows
 
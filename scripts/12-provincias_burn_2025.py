@@ -4,8 +4,11 @@
 import os
 import json
 import sys
+import numpy as np
 import pandas as pd
 import geopandas as gpd
+import shapely
+from pyproj import Transformer
 
 # --- CONFIG ---
 PROV_PATH = "./data/geo/output/provincia.geojson"      # debe tener NAMEUNIT
@@ -17,33 +20,74 @@ SHEET_NAME = "provincias 2025"
 # CRS para cálculo de áreas en m²: LAEA Europe
 AREA_EPSG = 3035
 
+# Campos de área admitidos en los fuegos (por orden de preferencia); el resto ni se lee
+AREA_FIELDS = ["area_ha", "AREA_HA", "areaHA", "area", "ha"]
+
 def ensure_dir(path: str):
     os.makedirs(os.path.dirname(path), exist_ok=True)
 
 def safe_make_valid(gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
     gdf = gdf.copy()
-    gdf["geometry"] = gdf["geometry"].buffer(0)
+    gdf["geometry"] = gpd.GeoSeries(
+        shapely.make_valid(gdf.geometry.to_numpy()), index=gdf.index, crs=gdf.crs
+    )
     return gdf
 
-def add_area_ha(gdf_ll: gpd.GeoDataFrame, epsg_area=AREA_EPSG, out_col="area_total_ha"):
-    gdf_m = gdf_ll.to_crs(epsg=epsg_area)
-    gdf_ll[out_col] = (gdf_m.geometry.area / 10000.0).values
-    return gdf_ll
+# Transformers cacheados por (CRS origen, CRS destino): cada uno se construye una vez
+_TRANSFORMERS = {}
+
+def _xf(src, dst):
+    key = (src, dst)
+    if key not in _TRANSFORMERS:
+        _TRANSFORMERS[key] = Transformer.from_crs(src, dst, always_xy=True)
+    return _TRANSFORMERS[key]
+
+def reproject(geoms, src, dst):
+    """Reproyecta un array de geometrías con el Transformer cacheado (todas las coords de golpe)."""
+    t = _xf(src, dst)
+    return shapely.transform(geoms, lambda xy: np.column_stack(t.transform(xy[:, 0], xy[:, 1])))
+
+def to_area_crs(gdf: gpd.GeoDataFrame, epsg=AREA_EPSG) -> gpd.GeoDataFrame:
+    """Equivale a gdf.to_crs(epsg=epsg), vía reproject."""
+    return gdf.set_geometry(reproject(gdf.geometry.to_numpy(), gdf.crs, epsg), crs=epsg)
 
 def filter_fires_min_ha(fires: gpd.GeoDataFrame, min_ha=30.0) -> gpd.GeoDataFrame:
     area_field = None
-    for cand in ["area_ha", "AREA_HA", "areaHA", "area", "ha"]:
+    for cand in AREA_FIELDS:
         if cand in fires.columns:
             area_field = cand
             break
     if area_field is None:
         # calcular geométricamente
-        fires_m = fires.to_crs(epsg=AREA_EPSG)
         fires = fires.copy()
-        fires["area_ha_geom"] = fires_m.geometry.area / 10000.0
+        fires["area_ha_geom"] = shapely.area(reproject(fires.geometry.to_numpy(), fires.crs, AREA_EPSG)) / 10000.0
         area_field = "area_ha_geom"
     return fires[fires[area_field] >= min_ha].copy()
 
+def burn_ha_by_unit(units_m: gpd.GeoDataFrame, fires_m: gpd.GeoDataFrame) -> dict:
+    """
+    Hectáreas quemadas por NAMEUNIT (ambos en CRS métrico). Filtro-refinado con
+    STRtree: solo se intersecan los fuegos cuyo bbox toca cada unidad. Las
+    unidades pueden venir en varias filas (partes sin disolver): se acumulan.
+    Los fuegos contenidos del todo en la unidad suman su área sin intersecar;
+    solo los que cruzan el borde pasan por shapely.intersection.
+    """
+    fire_geoms = fires_m.geometry.to_numpy()
+    unit_geoms = units_m.geometry.to_numpy()
+    shapely.prepare(unit_geoms)  # acelera contains sobre muchas candidatas
+
+    # Todos los pares (unidad, fuego) que se tocan, en una sola consulta al árbol
+    tree = shapely.STRtree(fire_geoms)
+    unit_idx, fire_idx = tree.query(unit_geoms, predicate="intersects")
+
+    units, fires = unit_geoms[unit_idx], fire_geoms[fire_idx]
+    m2 = shapely.area(fires)
+    border = ~shapely.contains(units, fires)
+    m2[border] = shapely.area(shapely.intersection(units[border], fires[border]))
+
+    names = units_m["NAMEUNIT"].to_numpy()[unit_idx]
+    return pd.Series(m2 / 10000.0).groupby(names).sum().to_dict()  # m² -> ha
+
 def main():
     # 1) Provincias
     if not os.path.exists(PROV_PATH):
@@ -51,7 +95,7 @@ def main():
     if not os.path.exists(FIRES_2025_PATH):
         raise FileNotFoundError(f"No existe {FIRES_2025_PATH}")
 
-    prov = gpd.read_file(PROV_PATH)
+    prov = gpd.read_file(PROV_PATH, engine="pyogrio", columns=["NAMEUNIT"])
     if prov.crs is None:
         raise ValueError("provincia.geojson no tiene CRS definido")
     if "NAMEUNIT" not in prov.columns:
@@ -59,44 +103,42 @@ def main():
 
     prov = safe_make_valid(prov)
 
-    # Disolver por NAMEUNIT por robustez (por si hay multipartes)
-    prov_diss = prov.dissolve(by="NAMEUNIT", as_index=False)
-    prov_diss = safe_make_valid(prov_diss)
-    prov_diss = add_area_ha(prov_diss, out_col="area_total_ha")
+    # Solo NAMEUNIT + geometría, ya en CRS métrico (área total e intersección)
+    prov_m = to_area_crs(prov[["NAMEUNIT", "geometry"]])
+
+    # Área total por provincia: suma de sus partes (no se solapan), sin disolver
+    prov_m["area_total_ha"] = shapely.area(prov_m.geometry.to_numpy()) / 10000.0
+    surface_df = prov_m.groupby("NAMEUNIT", as_index=False)["area_total_ha"].sum()
 
     # 2) Fuegos 2025 filtrados ≥ 30 ha
-    fires = gpd.read_file(FIRES_2025_PATH)
+    fires = gpd.read_file(FIRES_2025_PATH, engine="pyogrio", columns=AREA_FIELDS)
     if fires.crs is None:
         raise ValueError("ES_2025_fuegos.geojson no tiene CRS definido")
     fires = safe_make_valid(fires)
     fires_big = filter_fires_min_ha(fires, min_ha=30.0)
     fires_big = safe_make_valid(fires_big)
 
-    # 3) Overlay en CRS métrico
-    prov_m  = prov_diss.to_crs(epsg=AREA_EPSG)
-    fires_m = fires_big.to_crs(epsg=AREA_EPSG)
-
-    inter = gpd.overlay(prov_m, fires_m, how="intersection", keep_geom_type=True)
-    inter["burn_ha"] = inter.geometry.area / 10000.0
+    # 3) Intersección en CRS métrico
+    fires_m = to_area_crs(fires_big[["geometry"]])
 
-    # 4) Agregado por provincia
-    burn_by_prov = inter.groupby("NAMEUNIT", as_index=False)["burn_ha"].sum()
+    # 4) Área quemada por provincia (ha)
+    burn_by_prov = burn_ha_by_unit(prov_m, fires_m)
 
     # 5) Join con superficies totales
-    surface_df = prov_diss[["NAMEUNIT", "area_total_ha"]].copy()
-    out = pd.merge(surface_df, burn_by_prov, on="NAMEUNIT", how="left").fillna({"burn_ha": 0.0})
+    out = surface_df.copy()
+    out["burn_ha"] = out["NAMEUNIT"].map(burn_by_prov).fillna(0.0)
     out["pct"] = (out["burn_ha"] / out["area_total_ha"]) * 100.0
     out = out.sort_values("pct", ascending=False).reset_index(drop=True)
 
     # 6) Formato para Sheets
     header = ["Provincia", "Nombre provincia", "Superficie total (ha)", "Superficie quemada (ha)", "Porcentaje %"]
-    rows = []
-    for _, r in out.iterrows():
-        name = r["NAMEUNIT"]
-        total = r["area_total_ha"]
-        burn = r["burn_ha"]
-        pct = r["pct"]
-        rows.append([name, name, f"{total:.2f}", f"{burn:.2f}", f"{pct:.2f}"])
+    names = out["NAMEUNIT"].to_numpy().astype(str)
+    rows = np.column_stack([
+        names, names,
+        np.char.mod("%.2f", out["area_total_ha"].to_numpy()),
+        np.char.mod("%.2f", out["burn_ha"].to_numpy()),
+        np.char.mod("%.2f", out["pct"].to_numpy()),
+    ]).tolist()
 
     data_for_sheet = [header] + rows
 
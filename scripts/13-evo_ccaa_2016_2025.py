@@ -1,11 +1,20 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import hashlib
+import json
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from typing import Dict, List
 import geopandas as gpd
+import numpy as np
 import pandas as pd
+import pyarrow.parquet as pq
+import pyogrio
+import shapely
+from pyproj import CRS, Transformer
 
 # --- CONFIG ---
 AUTONOMIAS_PATH = "./data/geo/output/autonomias.geojson"  # Debe contener NAMEUNIT
@@ -13,7 +22,12 @@ FIRES_TEMPLATE = "./data/ES_{year}_fuegos.geojson"        # GeoJSON anual
 YEARS = list(range(2016, 2026))                           # 2016..2025
 AREA_EPSG = 3035                                          # CRS métrico para áreas
 OUT_CSV = "./data/output/evo_ccaa_2016_2025.csv"
+CCAA_CACHE_TEMPLATE = "./data/geo/output/ccaa_diss_m_{h}.parquet"  # CCAA disueltas en AREA_EPSG
 
+# Campos de área admitidos en los fuegos (por orden de preferencia); el resto ni se lee
+AREA_FIELDS = ["area_ha", "AREA_HA", "areaHA", "area", "ha"]
+
+@lru_cache(maxsize=None)  # misma etiqueta -> mismo str (DISPLAY_ORDER y el mapeo repiten muchas)
 def col(label: str) -> str:
     return f'<span style="font-weight:100">{label}</span>'
 
@@ -37,6 +51,8 @@ DISPLAY_ORDER = [
     col("La Rioja"),
     col("País Vasco"),
 ]
+# Posición de cada etiqueta en DISPLAY_ORDER (para acumular con np.bincount)
+LABEL_CODES = {label: i for i, label in enumerate(DISPLAY_ORDER)}
 
 # Entradas a ignorar (no van a Datawrapper en tu estructura)
 IGNORE_UNITS = {
@@ -80,67 +96,170 @@ def ensure_dir(path: str) -> None:
     os.makedirs(os.path.dirname(path), exist_ok=True)
 
 def safe_make_valid(gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+    # Arregla geometrías no válidas (shapely.make_valid vectorizado; buffer(0) puede perder partes)
     gdf = gdf.copy()
-    gdf["geometry"] = gdf["geometry"].buffer(0)
+    gdf["geometry"] = gpd.GeoSeries(
+        shapely.make_valid(gdf.geometry.to_numpy()), index=gdf.index, crs=gdf.crs
+    )
     return gdf
 
-def add_area_ha(gdf_ll: gpd.GeoDataFrame, epsg_area=AREA_EPSG, out_col="area_ha"):
-    gdf_m = gdf_ll.to_crs(epsg=epsg_area)
-    gdf_ll[out_col] = (gdf_m.geometry.area / 10000.0).values
-    return gdf_ll
-
-def filter_fires_min_ha(fires: gpd.GeoDataFrame, min_ha=30.0) -> gpd.GeoDataFrame:
-    field = next((c for c in ["area_ha", "AREA_HA", "areaHA", "area", "ha"] if c in fires.columns), None)
-    if field is None:
-        fires = add_area_ha(fires, out_col="area_ha_calc")
-        field = "area_ha_calc"
-    return fires[fires[field] >= min_ha].copy()
-
-def map_nameunit_to_label(name: str) -> str:
-    """Devuelve etiqueta DISPLAY o None si debe ignorarse."""
-    if name in IGNORE_UNITS:
-        return None
-    if name in NAMEUNIT_TO_DISPLAY:
-        return NAMEUNIT_TO_DISPLAY[name]
-    # Si viene en forma bilingüe "A/B" y alguna parte mapea, úsala.
-    if "/" in name:
-        parts = [p.strip() for p in name.split("/")]
-        for p in parts:
+def filter_fires_min_ha_m(fires: gpd.GeoDataFrame, min_ha=30.0) -> gpd.GeoDataFrame:
+    """Fuegos ≥ min_ha, ya en AREA_EPSG. Una sola reproyección: con campo de área
+    se filtra antes (solo se reproyectan los que quedan); sin él, el área se mide
+    sobre la misma geometría métrica que luego se interseca."""
+    field = next((c for c in AREA_FIELDS if c in fires.columns), None)
+    if field is not None:
+        return fires[fires[field] >= min_ha].to_crs(epsg=AREA_EPSG)
+    fires_m = fires.to_crs(epsg=AREA_EPSG)
+    areas_ha = shapely.area(fires_m.geometry.to_numpy()) / 10000.0
+    return fires_m[areas_ha >= min_ha]
+
+def dissolve_by_label(gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+    """Une las geometrías de cada LABEL (ordenadas por LABEL, como dissolve). Las CCAA
+    comparten bordes: si el grupo es una cobertura válida se usa coverage_union_all
+    (casi lineal); si no, union_all."""
+    geoms = gdf.geometry.to_numpy()
+    groups = gdf.groupby("LABEL").indices
+    diss_geoms = []
+    for idx in groups.values():
+        parts = geoms[idx]
+        try:
+            merged = shapely.coverage_union_all(parts) if shapely.coverage_is_valid(parts) else None
+        except shapely.errors.GEOSException:
+            merged = None
+        diss_geoms.append(merged if merged is not None else shapely.union_all(parts))
+    return gpd.GeoDataFrame({"LABEL": list(groups)}, geometry=diss_geoms, crs=gdf.crs)
+
+def build_label_map(names) -> Dict[str, str]:
+    """NAMEUNIT -> etiqueta DISPLAY, ampliado con las formas bilingües "A/B" presentes en names."""
+    label_map = dict(NAMEUNIT_TO_DISPLAY)
+    for name in names:
+        if name in label_map or "/" not in name:
+            continue
+        # Si viene en forma bilingüe "A/B" y alguna parte mapea, úsala.
+        for p in (p.strip() for p in name.split("/")):
             if p in NAMEUNIT_TO_DISPLAY:
-                return NAMEUNIT_TO_DISPLAY[p]
-    return None  # si no mapea, preferimos no colarlo
+                label_map[name] = NAMEUNIT_TO_DISPLAY[p]
+                break
+    return label_map  # lo que no mapea queda NaN: preferimos no colarlo
+
+def write_parquet_atomic(gdf: gpd.GeoDataFrame, path: str) -> None:
+    """GeoParquet (con columna bbox para leer filtrando) escrito a path + ".tmp" y
+    renombrado: una ejecución cortada nunca deja un fichero a medias."""
+    tmp_path = path + ".tmp"
+    gdf.to_parquet(tmp_path, write_covering_bbox=True)
+    os.replace(tmp_path, path)
+
+def source_signature(path: str) -> str:
+    """Tamaño + mtime (ns) del fichero: cambia si se reemplaza, aunque sea por uno más antiguo."""
+    st = os.stat(path)
+    return f"{st.st_size} {st.st_mtime_ns}"
+
+def bbox_to_crs(bbox_ll, crs) -> tuple:
+    """bbox en EPSG:4326 -> el mismo bbox en crs (bordes densificados); sin crs, tal cual."""
+    if crs is None or CRS.from_user_input(crs).equals(CRS.from_epsg(4326), ignore_axis_order=True):
+        return tuple(bbox_ll)
+    return Transformer.from_crs(4326, crs, always_xy=True).transform_bounds(*bbox_ll)
 
-def compute_year(year: int, ccaa_diss: gpd.GeoDataFrame) -> pd.Series:
+def parquet_crs(schema) -> CRS:
+    """CRS de la geometría principal según los metadatos 'geo' del GeoParquet
+    (sin clave crs el estándar dice OGC:CRS84; crs null = desconocido)."""
+    geo = json.loads(schema.metadata[b"geo"])
+    crs = geo["columns"][geo["primary_column"]].get("crs", "OGC:CRS84")
+    if crs is None:
+        return None
+    return CRS.from_json_dict(crs) if isinstance(crs, dict) else CRS.from_user_input(crs)
+
+def read_fires(fires_path: str, bbox_ll) -> gpd.GeoDataFrame:
+    """Lee un GeoJSON anual vía una copia GeoParquet (columnar, con bbox por fila).
+    La copia guarda al lado (.src) la firma del GeoJSON del que salió y se rehace
+    si no coincide con la actual."""
+    pq_path = os.path.splitext(fires_path)[0] + ".parquet"
+    sig_path = pq_path + ".src"
+    sig = source_signature(fires_path)
+    try:
+        with open(sig_path, encoding="utf-8") as f:
+            cached_sig = f.read()
+    except FileNotFoundError:
+        cached_sig = None
+    if cached_sig != sig or not os.path.exists(pq_path):
+        write_parquet_atomic(pyogrio.read_dataframe(fires_path, use_arrow=True), pq_path)
+        # La firma va después de la copia: si se corta antes, la vieja no coincide y se rehace
+        with open(sig_path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(sig)
+        os.replace(sig_path + ".tmp", sig_path)
+    # Solo geometría + campo de área, y solo fuegos dentro de la extensión de las CCAA,
+    # con el bbox pasado al CRS con el que se escribió la copia (el del GeoJSON)
+    schema = pq.read_schema(pq_path)
+    bbox = bbox_to_crs(bbox_ll, parquet_crs(schema))
+    columns = [c for c in AREA_FIELDS if c in schema.names] + ["geometry"]
+    return gpd.read_parquet(pq_path, columns=columns, bbox=bbox)
+
+def compute_year(year: int, ccaa_m: gpd.GeoDataFrame, ccaa_tree: shapely.STRtree,
+                 ccaa_bbox_ll) -> pd.Series:
+    # ccaa_m: CCAA disueltas, ya en AREA_EPSG; ccaa_tree: su STRtree (mismo orden de filas);
+    # ccaa_bbox_ll: su extensión en EPSG:4326
     fires_path = FIRES_TEMPLATE.format(year=year)
     if not os.path.exists(fires_path):
         raise FileNotFoundError(f"No existe {fires_path}")
 
-    fires = gpd.read_file(fires_path)
+    fires = read_fires(fires_path, ccaa_bbox_ll)
     if fires.crs is None:
         raise ValueError(f"{fires_path} no tiene CRS definido")
+    # Nada dentro de la extensión de las CCAA (la lectura ya filtra por bbox): ni reparar ni reproyectar
+    if fires.empty:
+        return pd.Series({label: 0 for label in DISPLAY_ORDER})
     fires = safe_make_valid(fires)
-    fires_big = filter_fires_min_ha(fires, 30.0)
-    fires_big = safe_make_valid(fires_big)
-    if fires_big.empty:
+    fires_m = filter_fires_min_ha_m(fires, 30.0)  # ya válidas: filtrar no las estropea
+    # A partir de aquí, arrays numpy de geometrías shapely (sin GeoSeries en el camino caliente)
+    fire_geoms = fires_m.geometry.to_numpy()
+    ccaa_geoms = ccaa_m.geometry.to_numpy()
+
+    # Descarte barato por bbox (numpy) de lo que cae fuera de la extensión métrica de las CCAA
+    minx, miny, maxx, maxy = shapely.total_bounds(ccaa_geoms)
+    b = shapely.bounds(fire_geoms)
+    keep = (b[:, 2] >= minx) & (b[:, 0] <= maxx) & (b[:, 3] >= miny) & (b[:, 1] <= maxy)
+    fire_geoms = fire_geoms[keep]
+    if len(fire_geoms) == 0:
         return pd.Series({label: 0 for label in DISPLAY_ORDER})
 
-    ccaa_m  = ccaa_diss.to_crs(epsg=AREA_EPSG)
-    fires_m = fires_big.to_crs(epsg=AREA_EPSG)
-    inter = gpd.overlay(ccaa_m, fires_m, how="intersection", keep_geom_type=True)
-    if inter.empty:
+    # Pares (fuego, CCAA) que se tocan, en una sola consulta al árbol de CCAA. Los
+    # fuegos contenidos del todo en su CCAA suman su área sin intersecar; solo los
+    # que cruzan el borde pasan por shapely.intersection
+    fire_idx, ccaa_idx = ccaa_tree.query(fire_geoms, predicate="intersects")
+    if len(fire_idx) == 0:
         return pd.Series({label: 0 for label in DISPLAY_ORDER})
 
-    inter["burn_ha"] = inter.geometry.area / 10000.0
-    grouped = inter.groupby("LABEL", as_index=False)["burn_ha"].sum()
+    units, fires = ccaa_geoms[ccaa_idx], fire_geoms[fire_idx]
+    m2 = shapely.area(fires)
+    border = ~shapely.contains(units, fires)  # CCAA preparadas en _init_worker
+    m2[border] = shapely.area(shapely.intersection(units[border], fires[border]))
+    burn_ha = m2 / 10000.0
+    ccaa_code = np.fromiter((LABEL_CODES[l] for l in ccaa_m["LABEL"]), dtype=np.int32, count=len(ccaa_m))
+    per_label = np.bincount(ccaa_code[ccaa_idx], weights=burn_ha, minlength=len(DISPLAY_ORDER))
+    return pd.Series(per_label, index=DISPLAY_ORDER)
 
-    s = grouped.set_index("LABEL")["burn_ha"].reindex(DISPLAY_ORDER).fillna(0.0)
-    return s
+# Estado por proceso (lo rellena _init_worker): CCAA métricas, su árbol y su extensión
+_WORKER: dict = {}
 
-def main():
-    if not os.path.exists(AUTONOMIAS_PATH):
-        raise FileNotFoundError(f"No existe {AUTONOMIAS_PATH}")
+def _init_worker(ccaa_wkb, labels: List[str], ccaa_bbox_ll) -> None:
+    # Las CCAA llegan como WKB (más barato de enviar que un GeoDataFrame) y se rehacen
+    # una vez por proceso, no por año
+    ccaa_m = gpd.GeoDataFrame({"LABEL": labels}, geometry=shapely.from_wkb(ccaa_wkb), crs=AREA_EPSG)
+    # Preparadas (in situ): las consultas de todos los años reutilizan la caché de GEOS
+    shapely.prepare(ccaa_m.geometry.to_numpy())
+    _WORKER["ccaa_m"] = ccaa_m
+    # Un solo árbol con las CCAA (pocas geometrías, muchos fuegos)
+    _WORKER["ccaa_tree"] = shapely.STRtree(ccaa_m.geometry.to_numpy())
+    _WORKER["ccaa_bbox_ll"] = ccaa_bbox_ll
 
-    ccaa = gpd.read_file(AUTONOMIAS_PATH)
+def _run_year(year: int) -> pd.Series:
+    print(f"-> Año {year}", flush=True)
+    return compute_year(year, _WORKER["ccaa_m"], _WORKER["ccaa_tree"], _WORKER["ccaa_bbox_ll"])
+
+def build_ccaa_diss_m() -> gpd.GeoDataFrame:
+    """Lee autonomias.geojson, repara, etiqueta, disuelve por LABEL y reproyecta a AREA_EPSG."""
+    ccaa = gpd.read_file(AUTONOMIAS_PATH, engine="pyogrio", use_arrow=True)
     if ccaa.crs is None:
         raise ValueError("autonomias.geojson no tiene CRS definido")
     if "NAMEUNIT" not in ccaa.columns:
@@ -149,7 +268,9 @@ def main():
     ccaa = safe_make_valid(ccaa)
 
     # Aplicar mapping / ignorar entradas
-    ccaa["LABEL"] = ccaa["NAMEUNIT"].apply(map_nameunit_to_label)
+    label_map = build_label_map(ccaa["NAMEUNIT"].dropna().unique())
+    ccaa["LABEL"] = ccaa["NAMEUNIT"].map(label_map)
+    ccaa.loc[ccaa["NAMEUNIT"].isin(IGNORE_UNITS), "LABEL"] = None
     # Avisos de lo que ignoramos (opcional)
     ignored = ccaa[ccaa["LABEL"].isna()]["NAMEUNIT"].unique().tolist()
     if ignored:
@@ -161,21 +282,58 @@ def main():
         raise RuntimeError("No quedaron CCAA válidas tras el mapping.")
 
     # Disolver por LABEL
-    ccaa_diss = ccaa_keep.dissolve(by="LABEL", as_index=False)
+    ccaa_diss = dissolve_by_label(ccaa_keep)
     ccaa_diss = safe_make_valid(ccaa_diss)
+    # Reproyectar una sola vez (no en cada año)
+    return ccaa_diss.to_crs(epsg=AREA_EPSG)
+
+def load_ccaa_diss_m() -> gpd.GeoDataFrame:
+    """build_ccaa_diss_m() cacheado en disco. La clave es el md5 de autonomias.geojson
+    y de este script: cambiar el mapeo, IGNORE_UNITS, DISPLAY_ORDER, col() o el
+    disuelto invalida la caché."""
+    h = hashlib.md5()
+    for path in (AUTONOMIAS_PATH, __file__):
+        with open(path, "rb") as f:
+            h.update(f.read())
+    cache_path = CCAA_CACHE_TEMPLATE.format(h=h.hexdigest()[:8])
+    if os.path.exists(cache_path):
+        cached = gpd.read_parquet(cache_path, columns=["LABEL", "geometry"])
+        if cached["LABEL"].isin(LABEL_CODES).all():  # por si acaso: nunca etiquetas desconocidas
+            print(f"ℹ️  CCAA desde caché: {cache_path}", file=sys.stderr)
+            return cached
+
+    ccaa_diss_m = build_ccaa_diss_m()
+    ensure_dir(cache_path)
+    write_parquet_atomic(ccaa_diss_m[["LABEL", "geometry"]], cache_path)
+    return ccaa_diss_m
+
+def main():
+    if not os.path.exists(AUTONOMIAS_PATH):
+        raise FileNotFoundError(f"No existe {AUTONOMIAS_PATH}")
+
+    ccaa_diss_m = load_ccaa_diss_m()
+    # Extensión en lon/lat (GeoJSON) para filtrar la lectura de los fuegos
+    ccaa_bbox_ll = ccaa_diss_m.to_crs(epsg=4326).total_bounds
+
+    # Años independientes (un GeoJSON cada uno): en paralelo, un proceso por núcleo
+    init_args = (
+        shapely.to_wkb(ccaa_diss_m.geometry.to_numpy()),
+        ccaa_diss_m["LABEL"].tolist(),
+        ccaa_bbox_ll,
+    )
+    workers = min(len(YEARS), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=init_args) as ex:
+        results = list(ex.map(_run_year, YEARS))
 
-    # Tabla año a año
-    rows: List[dict] = []
-    for y in YEARS:
-        print(f"-> Año {y}")
-        s = compute_year(y, ccaa_diss)
-        row = {"fireyear": y}
-        row.update({label: float(s[label]) for label in DISPLAY_ORDER})
-        rows.append(row)
+    # Tabla año a año (filas = YEARS, columnas = DISPLAY_ORDER)
+    arr = np.zeros((len(YEARS), len(DISPLAY_ORDER)), dtype=np.float64)
+    for i, s in enumerate(results):
+        arr[i] = s.reindex(DISPLAY_ORDER).to_numpy()
 
-    df = pd.DataFrame(rows, columns=["fireyear"] + DISPLAY_ORDER)
+    df = pd.DataFrame(arr.round().astype(np.int64), columns=DISPLAY_ORDER)  # entero en ha como en uno.csv
+    df.insert(0, "fireyear", YEARS)
     ensure_dir(OUT_CSV)
-    df.to_csv(OUT_CSV, index=False, float_format="%.0f")  # entero en ha como en uno.csv
+    df.to_csv(OUT_CSV, index=False)
     print(f"✅ Guardado CSV: {OUT_CSV}")
     print(df.head(3).to_string(index=False))
 
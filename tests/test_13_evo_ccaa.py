@@ -0,0 +1,66 @@
+import importlib.util
+from pathlib import Path
+
+import geopandas as gpd
+from shapely.geometry import box
+
+SCRIPT = Path(__file__).resolve().parents[1] / "scripts" / "13-evo_ccaa_2016_2025.py"
+
+
+def load_script():
+    spec = importlib.util.spec_from_file_location("evo_ccaa", SCRIPT)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def fires_ll():
+    # Tres fuegos (~0.1° de lado, bastante más de 30 ha) en torno a Madrid
+    geoms = [box(-3.8 + i * 0.2, 40.3, -3.7 + i * 0.2, 40.4) for i in range(3)]
+    return gpd.GeoDataFrame({"area_ha": [1000.0] * 3}, geometry=geoms, crs=4326)
+
+
+def test_read_fires_non_4326_file(tmp_path):
+    m = load_script()
+    path = tmp_path / "ES_2020_fuegos.geojson"
+    fires_ll().to_crs(25830).to_file(path, driver="GeoJSON")
+
+    fires = m.read_fires(str(path), (-4.0, 40.0, -3.0, 41.0))
+    assert len(fires) == 3
+    assert fires.crs.to_epsg() == 25830
+
+    # Fuera de la extensión: nada
+    assert m.read_fires(str(path), (0.0, 42.0, 1.0, 43.0)).empty
+
+
+def test_parquet_copy_keeps_source_crs(tmp_path):
+    m = load_script()
+    path = tmp_path / "ES_2021_fuegos.geojson"
+    fires_ll().to_crs(3035).to_file(path, driver="GeoJSON")
+
+    m.read_fires(str(path), (-4.0, 40.0, -3.0, 41.0))  # genera la copia
+    schema = m.pq.read_schema(str(tmp_path / "ES_2021_fuegos.parquet"))
+    assert m.parquet_crs(schema).to_epsg() == 3035
+    # Segunda lectura, ya desde la copia: mismo filtrado en el CRS de la copia
+    assert len(m.read_fires(str(path), (-4.0, 40.0, -3.0, 41.0))) == 3
+
+
+def test_compute_year_same_burn_in_any_crs(tmp_path, monkeypatch):
+    m = load_script()
+    ccaa = gpd.GeoDataFrame({"NAMEUNIT": ["Comunidad de Madrid"]}, geometry=[box(-4.0, 40.0, -3.0, 41.0)], crs=4326)
+    ccaa_path = tmp_path / "autonomias.geojson"
+    ccaa.to_file(ccaa_path, driver="GeoJSON")
+    monkeypatch.setattr(m, "AUTONOMIAS_PATH", str(ccaa_path))
+    ccaa_m = m.build_ccaa_diss_m()
+    tree = m.shapely.STRtree(ccaa_m.geometry.to_numpy())
+    bbox_ll = ccaa_m.to_crs(epsg=4326).total_bounds
+
+    burn = {}
+    for year, epsg in [(2019, 4326), (2020, 25830)]:
+        fires_ll().to_crs(epsg).to_file(tmp_path / f"ES_{year}_fuegos.geojson", driver="GeoJSON")
+    monkeypatch.setattr(m, "FIRES_TEMPLATE", str(tmp_path / "ES_{year}_fuegos.geojson"))
+    for year in (2019, 2020):
+        burn[year] = m.compute_year(year, ccaa_m, tree, bbox_ll)[m.col("Madrid")]
+
+    assert burn[2019] > 0
+    assert abs(burn[2019] - burn[2020]) < 1e-3 * burn[2019]